@@ -0,0 +1,268 @@
+"""Micro-benchmark: bitboard Connect 4 engine vs the old list-based one.
+
+Plays the same random games on both engines and reports moves per second.
+The bitboard engine is also checked against a brute-force scan of every line
+after each move (the old engine missed diagonals reaching the last column, so
+it can't be the reference). Run from the repo root:
+
+    python benchmarks/connect4_bench.py [games]
+"""
+import os
+import sys
+import time
+import random
+from typing import Union
+from itertools import groupby, chain
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the cog checks its config on import, the values don't matter here
+for var in ("GUILD_ID", "CONNECT4_MAX_USER_POINTS", "CONNECT4_TOTAL_DISTRIBUTION_LIMIT", "CONNECT4_POINTS_PER_WIN"):
+    os.environ.setdefault(var, "1")
+
+from cogs.games.connect4 import Connect4Game  # noqa: E402
+
+
+# the list-based engine as it was before the bitboard rewrite
+class LegacyBoard(list):
+    __slots__ = frozenset({'width', 'height'})
+    def __init__(self, width, height, player1_name=None, player2_name=None):
+        self.width = width
+        self.height = height
+        for _ in range(width):
+            self.append([0] * height)
+
+    def __getitem__(self, pos: Union[int, tuple]):
+        if isinstance(pos, int):
+            return list(self)[pos]
+        elif isinstance(pos, tuple):
+            x, y = pos
+            return list(self)[x][y]
+        else:
+            raise TypeError('pos must be an int or tuple')
+
+    def __setitem__(self, pos: Union[int, tuple], new_value):
+        x, y = self._xy(pos)
+        if self[x, y] != 0:
+            raise IndexError("there's already a move at that position")
+        # basically self[x][y] = new_value
+        # super().__getitem__(x).__setitem__(y, new_value)
+        self[x][y] = new_value
+
+    def _xy(self, pos):
+        if isinstance(pos, tuple):
+            return pos[0], pos[1]
+        elif isinstance(pos, int):
+            x = pos
+            return x, self._y(x)
+        else:
+            raise TypeError('pos must be an int or tuple')
+
+    def _y(self, x):
+        """find the lowest empty row for column x"""
+        # start from the bottom and work up
+        for y in range(self.height-1, -1, -1):
+            if self[x, y] == 0:
+                return y
+        raise ValueError('that column is full')
+
+    def _pos_diagonals(self):
+        """Get positive diagonals, going from bottom-left to top-right."""
+        for di in ([(j, i - j) for j in range(self.width)] for i in range(self.width + self.height - 1)):
+            yield [self[i, j] for i, j in di if i >= 0 and j >= 0 and i < self.width and j < self.height]
+
+    def _neg_diagonals(self):
+        """Get negative diagonals, going from top-left to bottom-right."""
+        for di in ([(j, i - self.width + j + 1) for j in range(self.height)] for i in range(self.width + self.height - 1)):
+            yield [self[i, j] for i, j in di if i >= 0 and j >= 0 and i < self.width and j < self.height]
+
+    def _full(self):
+        """is there a move in every position?"""
+        for x in range(self.width):
+            if self[x, 0] == 0:
+                return False
+        return True
+
+class LegacyConnect4Game:
+    __slots__ = frozenset({'board', 'turn_count', '_whomst_forfeited', 'names'})
+    FORFEIT = -2
+    TIE = -1
+    NO_WINNER = 0
+    PIECES = (
+        '\N{medium white circle}'
+        '\N{large red circle}'
+        '\N{large blue circle}'
+    )
+
+    def __init__(self, player1_name=None, player2_name=None):
+        if player1_name is not None and player2_name is not None:
+            self.names = (player1_name, player2_name)
+        else:
+            self.names = ('Player 1', 'Player 2')
+        self.board = LegacyBoard(7, 6)
+        self.turn_count = 0
+        self._whomst_forfeited = 0
+
+    def move(self, column):
+        self.board[column] = self.whomst_turn()
+        self.turn_count += 1
+
+    def forfeit(self):
+        """forfeit the game as the current player"""
+        self._whomst_forfeited = self.whomst_turn_name()
+
+    def _get_forfeit_status(self):
+        if self._whomst_forfeited:
+            status = '{} won ({} forfeited)\n'
+            return status.format(
+                self.other_player_name(),
+                self.whomst_turn_name()
+            )
+        raise ValueError('nobody has forfeited')
+
+    def __str__(self):
+        win_status = self.whomst_won()
+        status = self._get_status()
+        instructions = ''
+        if win_status == self.NO_WINNER:
+            instructions = self._get_instructions()
+        elif win_status == self.FORFEIT:
+            status = self._get_forfeit_status()
+        return (
+            status
+            + instructions
+            + '\n'.join(self._format_row(y) for y in range(self.board.height))
+        )
+
+    def _get_status(self):
+        win_status = self.whomst_won()
+        if win_status == self.NO_WINNER:
+            status = (self.whomst_turn_name() + "'s turn"
+                + self.PIECES[self.whomst_turn()])
+        elif win_status == self.TIE:
+            status = "It's a tie!"
+        elif win_status == self.FORFEIT:
+            status = self._get_forfeit_status()
+        else:
+            status = self._get_player_name(win_status) + ' won!'
+        return status + '\n'
+
+    def _get_instructions(self):
+        instructions = ''
+        for i in range(1, self.board.width+1):
+            instructions += str(i) + '\N{combining enclosing keycap}'
+        return instructions + '\n'
+
+    def _format_row(self, y):
+        return ''.join(self[x, y] for x in range(self.board.width))
+
+    def __getitem__(self, pos):
+        x, y = pos
+        return self.PIECES[self.board[x, y]]
+
+    def whomst_won(self):
+        """Get the winner on the current board.
+        If there's no winner yet, return Connect4Game.NO_WINNER.
+        If it's a tie, return Connect4Game.TIE"""
+        lines = (
+            self.board, # columns
+            zip(*self.board), # rows (zip picks the nth item from each column)
+            self.board._pos_diagonals(), # positive diagonals
+            self.board._neg_diagonals(), # negative diagonals
+        )
+        if self._whomst_forfeited:
+            return self.FORFEIT
+        for line in chain(*lines):
+            for player, group in groupby(line):
+                if player != 0 and len(list(group)) >= 4:
+                    return player
+        if self.board._full():
+            return self.TIE
+        else:
+            return self.NO_WINNER
+
+    def other_player_name(self):
+        self.turn_count += 1
+        other_player_name = self.whomst_turn_name()
+        self.turn_count -= 1
+        return other_player_name
+
+    def whomst_turn_name(self):
+        return self._get_player_name(self.whomst_turn())
+
+    def whomst_turn(self):
+        return self.turn_count%2+1
+
+    def _get_player_name(self, player_number):
+        player_number -= 1 # these lists are 0-indexed but the players aren't
+        return self.names[player_number]
+
+
+def reference_winner(game):
+    """Scan every cell in every direction for four in a row."""
+    board = game.board
+    for x in range(board.width):
+        for y in range(board.height):
+            player = board[x, y]
+            if not player:
+                continue
+            for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                cells = [(x + dx * k, y + dy * k) for k in range(4)]
+                if all(0 <= cx < board.width and 0 <= cy < board.height and board[cx, cy] == player for cx, cy in cells):
+                    return player
+    return game.TIE if board._full() else game.NO_WINNER
+
+
+def random_games(count, seed=0):
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = Connect4Game()
+        columns = []
+        while game.whomst_won() == game.NO_WINNER:
+            column = rng.choice([x for x in range(7) if game.board[x, 0] == 0])
+            game.move(column)
+            columns.append(column)
+        games.append(columns)
+    return games
+
+
+def play(engine, games, render):
+    """Replay every game the way the cog does: move, check status and render."""
+    moves = 0
+    start = time.perf_counter()
+    for columns in games:
+        game = engine()
+        for column in columns:
+            game.move(column)
+            game.whomst_won()
+            if render:
+                str(game)
+            moves += 1
+    return moves, time.perf_counter() - start
+
+
+def check(games):
+    for columns in games:
+        game = Connect4Game()
+        for column in columns:
+            game.move(column)
+            assert game.whomst_won() == reference_winner(game), columns
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    games = random_games(count)
+    check(games)
+    print(f"{count} random games, bitboard engine matches the reference on every move")
+    for render in (False, True):
+        print("move + status + render" if render else "move + status")
+        results = {}
+        for name, engine in (("list", LegacyConnect4Game), ("bitboard", Connect4Game)):
+            moves, elapsed = play(engine, games, render)
+            results[name] = elapsed
+            print(f"{name:>11}: {moves} moves in {elapsed:.3f}s ({moves / elapsed:,.0f} moves/s)")
+        print(f"    speedup: {results['list'] / results['bitboard']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
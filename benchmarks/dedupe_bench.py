@@ -0,0 +1,82 @@
+"""Benchmark: RaydiumListener's signature dedupe at millions of signatures.
+
+Streams random signature-sized strings through SignatureFilter, timing only
+the adds, then checks that the most recent signatures are still caught as
+replays and measures the false positive rate on fresh ones. The memory of a
+plain set holding the same signatures is measured for comparison. Run from
+the repo root:
+
+    python benchmarks/dedupe_bench.py [signatures]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.blockchainscanner.dedupe import SignatureFilter  # noqa: E402
+
+CHUNK = 100_000
+SET_SAMPLE = 1_000_000
+
+
+def signatures(count):
+    """Chunks of random 88 character strings, the length of a base58 signature."""
+    while count > 0:
+        size = min(CHUNK, count)
+        yield [os.urandom(44).hex() for _ in range(size)]
+        count -= size
+
+
+def set_bytes_per_signature():
+    tracemalloc.start()
+    seen = set()
+    for chunk in signatures(SET_SAMPLE):
+        seen.update(chunk)
+        del chunk
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(seen)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    dedupe = SignatureFilter()
+    recent = deque(maxlen=100_000)
+    elapsed = 0.0
+    duplicates = 0
+    for chunk in signatures(total):
+        started = time.perf_counter()
+        for signature in chunk:
+            if not dedupe.add(signature):
+                duplicates += 1
+        elapsed += time.perf_counter() - started
+        recent.extend(chunk)
+    print(f"added {total:,} signatures at {total / elapsed:,.0f}/s ({elapsed / total * 1e6:.2f} us each), "
+          f"{dedupe.rotations} rotations")
+
+    replays = sum(signature in dedupe for signature in recent)
+    assert replays == len(recent), 'a recent signature was forgotten'
+    started = time.perf_counter()
+    for signature in recent:
+        dedupe.add(signature)
+    print(f"all {len(recent):,} most recent signatures caught as replays, {len(recent) / (time.perf_counter() - started):,.0f} replay checks/s")
+
+    fresh = 0
+    false_positives = duplicates
+    for chunk in signatures(1_000_000):
+        false_positives += sum(signature in dedupe for signature in chunk)
+        fresh += len(chunk)
+    print(f"false positives: {false_positives} in {fresh + total:,} fresh lookups "
+          f"({false_positives / (fresh + total):.2e}, configured {dedupe.fp_rate:.0e})")
+
+    per_signature = set_bytes_per_signature()
+    print(f"memory: filter {dedupe.memory() / 2**20:.1f} MiB flat (capacity {dedupe.capacity:,} per generation), "
+          f"a set would hold {per_signature * total / 2**20:,.0f} MiB after {total:,} signatures and keep growing "
+          f"({per_signature:.0f} bytes each)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Stand-ins for the discord.py objects the game cogs touch, shared by the benchmarks."""
+
+
+class Member:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.mention = f'<@{user_id}>'
+
+
+class Message:
+    ids = iter(range(10**12, 10**13))
+
+    def __init__(self):
+        self.id = next(self.ids)
+        self.content = None
+
+    async def edit(self, content=None, view=None):
+        self.content = content
+
+
+class Response:
+    def __init__(self, message):
+        self.message = message
+        self.ephemeral = []
+
+    async def send_message(self, content=None, view=None, ephemeral=False):
+        if ephemeral:
+            self.ephemeral.append(content)
+        else:
+            self.message.content = content
+
+    async def edit_message(self, content=None, view=None):
+        self.message.content = content
+
+
+class Interaction:
+    def __init__(self, user, message):
+        self.user = user
+        self.message = message
+        self.response = Response(message)
+
+    async def original_response(self):
+        return self.message
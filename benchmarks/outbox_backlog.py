@@ -0,0 +1,87 @@
+"""Benchmark: the outbox working through a large bulk backlog.
+
+Queues a backlog of bulk sends (DMs to distinct users, or all to one channel)
+with the real rate limits and stand-in sends that take a fixed time, then for
+a few seconds measures how many go out, how often the outbox had to look at a
+job before it could send it, how late a 10 ms sleep on the event loop wakes
+up, and how long interactive sends queued behind the backlog wait. Run from
+the repo root:
+
+    python benchmarks/outbox_backlog.py [--jobs N] [--route dm|channel] [--seconds S]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.outbox import Outbox, BULK, INTERACTIVE  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+def percentile(values, quantile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * quantile))] if values else 0.0
+
+
+async def bench(jobs, route_kind, seconds, send_time):
+    outbox = Outbox()
+    admits = 0
+    admit = outbox._admit
+
+    async def counted_admit(item):
+        nonlocal admits
+        admits += 1
+        return await admit(item)
+
+    outbox._admit = counted_admit
+    outbox.start()
+
+    async def send():
+        await asyncio.sleep(send_time)
+
+    started = time.perf_counter()
+    for index in range(jobs):
+        outbox.submit(('dm', index) if route_kind == 'dm' else ('channel', 1), send, BULK)
+    queued_in = time.perf_counter() - started
+
+    lags = []
+    interactive = []
+    deadline = time.perf_counter() + seconds
+    next_interactive = 0.0
+    while (now := time.perf_counter()) < deadline:
+        if now >= next_interactive:
+            # someone playing a game while the backlog drains, each on their own channel
+            submitted = now
+            future = outbox.submit(('interaction', len(interactive)), send, INTERACTIVE)
+            future.add_done_callback(lambda _, submitted=submitted: interactive.append(time.perf_counter() - submitted))
+            next_interactive = now + 0.5
+        before = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - before - PROBE_INTERVAL)
+    elapsed = time.perf_counter() - started - queued_in
+    sent = outbox.sent - len(interactive)
+    await outbox.close()
+
+    print(f"{jobs} bulk jobs to {'distinct DMs' if route_kind == 'dm' else 'one channel'}, queued in {queued_in * 1000:.0f} ms")
+    print(f"  sent {sent} in {elapsed:.1f}s ({sent / elapsed:.1f} msgs/s, global rate {outbox._global.capacity}/s), {outbox.stats()['queued']} still queued")
+    print(f"  jobs admitted or parked {admits} times for {outbox.sent} sends")
+    print(f"  loop lag p50 {percentile(lags, 0.5) * 1000:.1f} ms, p99 {percentile(lags, 0.99) * 1000:.1f} ms, max {max(lags) * 1000:.1f} ms")
+    print(f"  interactive sends {len(interactive)}, wait p50 {percentile(interactive, 0.5) * 1000:.0f} ms, max {max(interactive, default=0) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--route", choices=("dm", "channel"), default="dm")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--send-time", type=float, default=0.05, help="seconds each stand-in send takes")
+    args = parser.parse_args()
+    asyncio.run(bench(args.jobs, args.route, args.seconds, args.send_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""Record/replay harness for RaydiumListener, so it can be measured without the node.
+
+``record`` captures the logsSubscribe frames of the node at RPC_URL/WS_URL and
+the getTransaction response of every pool init among them into a gzipped JSON
+lines file. ``synth`` writes a recording of made-up traffic in the same format
+for when there's no node at hand. ``serve`` replays a recording from a local
+websocket and JSON-RPC stand-in that the bot can be pointed at with RPC_URL and
+WS_URL, and ``bench`` does the same into the real cog and reports the frames it
+handles per second, the getTransaction latency and the time from a frame leaving
+the stand-in to the pool being sent to Discord. Run from the repo root:
+
+    python benchmarks/raydium_replay.py record FILE [--seconds 300]
+    python benchmarks/raydium_replay.py synth FILE [--frames 50000] [--pools 100] [--rate 2000]
+    python benchmarks/raydium_replay.py serve FILE [--speed 1|10|max]
+    python benchmarks/raydium_replay.py bench FILE [--speed 1|10|max] [--rpc-latency MS] [--discord-limits]
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HOST = "127.0.0.1"
+HTTP_PORT = 18899
+WS_PORT = 18900
+BASE58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+SLOT_SECONDS = 0.4
+
+
+def listener():
+    """Import the cog once RPC_URL/WS_URL are set, it reads them on import."""
+    os.environ.setdefault("DISCORD_CHANNEL_ID", "1")
+    from cogs.blockchainscanner import raydium_listener
+    return raydium_listener
+
+
+def signature_of(frame):
+    return json.loads(frame)["params"]["result"]["value"]["signature"]
+
+
+def percentiles(values, quantiles=(0.5, 0.95, 0.99)):
+    values = sorted(values)
+    return [values[min(len(values) - 1, int(len(values) * q))] for q in quantiles] if values else [0.0] * len(quantiles)
+
+
+# recordings: a header line, then {"t": seconds, "f": frame} and {"s": signature, "tx": result} lines
+
+def load(path):
+    frames, transactions = [], {}
+    with gzip.open(path, "rt") as recording:
+        next(recording)
+        for line in recording:
+            item = json.loads(line)
+            if "f" in item:
+                frames.append((item["t"], item["f"]))
+            else:
+                transactions[item["s"]] = item["tx"]
+    return frames, transactions
+
+
+async def record(path, seconds):
+    rl = listener()
+    import websockets
+    from cogs.blockchainscanner.rpc import BatchRpcClient
+
+    rpc = BatchRpcClient(rl.RPC_URL)
+    fetches = []
+    counts = {"frames": 0, "transactions": 0}
+    with gzip.open(path, "wt") as out:
+        def write(item):
+            out.write(json.dumps(item, separators=(",", ":")) + "\n")
+
+        async def fetch(signature):
+            try:
+                transaction, = await rpc.get_transactions([signature])
+            except Exception as error:
+                print(f"Could not fetch {signature} {error!r}")
+                return
+            write({"s": signature, "tx": transaction})
+            counts["transactions"] += 1
+
+        write({"program": rl.RAYDIUM_PROGRAM_ID, "recorded_at": time.time(), "ws": rl.WS_URL})
+        async with websockets.connect(rl.WS_URL, max_size=None) as websocket:
+            await websocket.send(json.dumps({
+                "jsonrpc": "2.0", "id": 1, "method": "logsSubscribe",
+                "params": [{"mentions": [rl.RAYDIUM_PROGRAM_ID]}, {"commitment": "finalized"}]
+            }))
+            started = time.monotonic()
+            print(f"Recording {rl.WS_URL} for {seconds:.0f}s ...")
+            while (remaining := started + seconds - time.monotonic()) > 0:
+                try:
+                    frame = await asyncio.wait_for(websocket.recv(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                write({"t": round(time.monotonic() - started, 6), "f": frame})
+                counts["frames"] += 1
+                if rl.POOL_MARKER in frame and '"signature"' in frame:
+                    fetches.append(asyncio.create_task(fetch(signature_of(frame))))
+        await asyncio.gather(*fetches)
+    await rpc.close()
+    print(f"Recorded {counts['frames']:,} frames and {counts['transactions']} pool transactions "
+          f"to {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+
+def synthesize(path, frames, pools, rate, seed=1):
+    """A recording of ``frames`` swap notifications at ``rate``/s with ``pools`` pool inits spread through them."""
+    rl = listener()
+    rng = random.Random(seed)
+
+    def key(length=44):
+        return "".join(rng.choices(BASE58, k=length))
+
+    def logs(init):
+        program = rl.RAYDIUM_PROGRAM_ID
+        lines = [
+            "Program ComputeBudget111111111111111111111111111111 invoke [1]",
+            "Program ComputeBudget111111111111111111111111111111 success",
+            f"Program {program} invoke [1]",
+            f"Program log: {'initialize2: InitializeInstruction2 { nonce: 254, open_time: 0 }' if init else 'ray_log: ' + key(60)}",
+        ]
+        for _ in range(rng.randint(2, 4)):
+            lines += ["Program TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA invoke [2]", "Program log: Instruction: Transfer",
+                      "Program TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA consumed 4645 of 180000 compute units",
+                      "Program TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA success"]
+        return lines + [f"Program {program} consumed 31234 of 200000 compute units", f"Program {program} success"]
+
+    pool_at = set(rng.sample(range(1, frames), pools))
+    started_at = int(time.time())
+    with gzip.open(path, "wt") as out:
+        def write(item):
+            out.write(json.dumps(item, separators=(",", ":")) + "\n")
+
+        write({"program": rl.RAYDIUM_PROGRAM_ID, "recorded_at": started_at, "ws": "synthetic"})
+        write({"t": 0.0, "f": json.dumps({"jsonrpc": "2.0", "result": 1, "id": 1})})
+        t = 0.0
+        for n in range(1, frames):
+            t += rng.expovariate(rate)
+            slot = 250_000_000 + int(t / SLOT_SECONDS)
+            signature = key(88)
+            init = n in pool_at
+            lines = logs(init)
+            write({"t": round(t, 6), "f": json.dumps({
+                "jsonrpc": "2.0", "method": "logsNotification",
+                "params": {"result": {"context": {"slot": slot}, "value": {"signature": signature, "err": None, "logs": lines}},
+                           "subscription": 1}
+            })})
+            if init:
+                accounts = [key() for _ in range(21)]
+                if rng.random() < 0.5:
+                    accounts[rl.TOKEN0_ACCOUNT] = rl.WSOL_MINT
+                else:
+                    accounts[rl.TOKEN1_ACCOUNT] = rl.WSOL_MINT
+                write({"s": signature, "tx": {
+                    "slot": slot, "blockTime": started_at + int(t),
+                    "meta": {"err": None, "logMessages": lines},
+                    "transaction": {"signatures": [signature], "message": {"instructions": [
+                        {"programId": "ComputeBudget111111111111111111111111111111", "accounts": [], "data": key(10)},
+                        {"programId": rl.RAYDIUM_PROGRAM_ID, "accounts": accounts, "data": key(40)},
+                    ]}},
+                }})
+    print(f"Wrote {frames:,} frames ({pools} pool inits, {rate:,.0f}/s over {t:.1f}s) to {path} "
+          f"({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+
+class StandIn:
+    """Local websocket and JSON-RPC node serving a recording.
+
+    The first subscriber gets every recorded frame, at ``speed`` times the
+    recorded pace or as fast as the socket takes them when speed is 0. Later
+    connections (the listener reconnecting) get nothing more. getTransaction
+    answers from the recording, getSignaturesForAddress has nothing to backfill.
+    """
+
+    def __init__(self, frames, transactions, speed=1.0, rpc_latency=0.0):
+        self.frames = frames
+        self.transactions = transactions
+        self.speed = speed
+        self.rpc_latency = rpc_latency
+        self.sent_at = {}  # pool init signature -> wall clock time its frame went out
+        self.started_at = None
+        self.finished_at = None
+        self.replayed = asyncio.Event()
+        self.http_requests = 0
+        self._servers = []
+
+    async def start(self, host=HOST, http_port=HTTP_PORT, ws_port=WS_PORT):
+        import websockets
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post("/", self.handle_rpc)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, http_port).start()
+        # like the node's pubsub, no permessage-deflate: compressing every frame would be most of the cost
+        self._servers.append(await websockets.serve(self.handle_socket, host, ws_port, max_size=None, compression=None))
+        return f"http://{host}:{http_port}/", f"ws://{host}:{ws_port}/"
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        await self._runner.cleanup()
+
+    async def handle_socket(self, websocket):
+        await websocket.recv()  # the subscription
+        if self.started_at is not None:
+            await websocket.wait_closed()
+            return
+        from cogs.blockchainscanner.raydium_listener import POOL_MARKER
+        clock = time.time  # compared with times taken in the benchmark's process
+        self.started_at = started = clock()
+        for t, frame in self.frames:
+            if self.speed:
+                delay = started + t / self.speed - clock()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if POOL_MARKER in frame:
+                self.sent_at.setdefault(signature_of(frame), clock())
+            await websocket.send(frame)
+        self.finished_at = clock()
+        self.replayed.set()
+        await websocket.wait_closed()
+
+    async def handle_rpc(self, request):
+        from aiohttp import web
+
+        body = await request.json()
+        self.http_requests += 1
+        if self.rpc_latency:
+            await asyncio.sleep(self.rpc_latency)
+        if isinstance(body, list):
+            return web.json_response([self.answer(item) for item in body])
+        return web.json_response(self.answer(body))
+
+    def answer(self, item):
+        method = item.get("method")
+        if method == "getTransaction":
+            result = self.transactions.get(item["params"][0])
+        elif method == "getSignaturesForAddress":
+            result = []
+        else:
+            return {"jsonrpc": "2.0", "id": item.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": item.get("id"), "result": result}
+
+
+async def serve(path, speed):
+    frames, transactions = load(path)
+    stand_in = StandIn(frames, transactions, speed)
+    rpc_url, ws_url = await stand_in.start()
+    print(f"Serving {len(frames):,} frames from {path}, start the bot with RPC_URL={rpc_url} WS_URL={ws_url}")
+    try:
+        await stand_in.replayed.wait()
+        print(f"Replayed every frame in {stand_in.finished_at - stand_in.started_at:.1f}s, still answering RPC.")
+        await asyncio.Event().wait()
+    finally:
+        await stand_in.close()
+
+
+def stand_in_process(path, speed, rpc_latency, connection):
+    """Run the stand-in in its own process so it doesn't compete with the cog for the event loop."""
+    async def run():
+        frames, transactions = load(path)
+        stand_in = StandIn(frames, transactions, speed, rpc_latency)
+        connection.send(await stand_in.start())
+        await stand_in.replayed.wait()
+        connection.send((stand_in.started_at, stand_in.finished_at, stand_in.sent_at))
+        await asyncio.get_running_loop().run_in_executor(None, connection.recv)  # until the benchmark is done
+        connection.send(stand_in.http_requests)
+        await stand_in.close()
+    asyncio.run(run())
+
+
+class Channel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.posts = []  # (wall clock time, description)
+
+    async def send(self, embed=None):
+        self.posts.append((time.time(), embed.description))
+        return embed  # stands in for the sent message
+
+
+class Client:
+    """The bits of the bot the cog uses."""
+
+    def __init__(self, db, outbox):
+        self.db = db
+        self.outbox = outbox
+        self.loop = asyncio.get_running_loop()
+        self.channel = Channel(int(os.environ["DISCORD_CHANNEL_ID"]))
+
+    def get_channel(self, channel_id):
+        return self.channel
+
+    async def wait_until_ready(self):
+        pass
+
+
+async def bench(path, speed, rpc_latency, discord_limits):
+    frames, transactions = load(path)
+    connection, child_connection = multiprocessing.Pipe()
+    process = multiprocessing.get_context("spawn").Process(
+        target=stand_in_process, args=(path, speed, rpc_latency, child_connection), daemon=True
+    )
+    process.start()
+    receive = partial(asyncio.get_running_loop().run_in_executor, None, connection.recv)
+    os.environ["RPC_URL"], os.environ["WS_URL"] = await receive()
+    rl = listener()
+    from utils.database import Database
+    from utils.outbox import Outbox
+
+    # which token each pool announces, and which pool each announcement is
+    announced = {}
+    for signature, transaction in transactions.items():
+        pool = transaction and rl.parse_pool(transaction)
+        if pool:
+            _, token0, token1, _ = pool
+            announced[token1 if token0 == rl.WSOL_MINT else token0] = signature
+    expected = sum(1 for _, frame in frames if rl.POOL_MARKER in frame and signature_of(frame) in transactions)
+
+    db = Database(os.path.join(tempfile.mkdtemp(), "replay.db"))
+    await db.connect()
+    # the cog's prints would drown the report, keep them for when something goes wrong
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        await db.init_db()
+    outbox = Outbox() if discord_limits else Outbox(route_rate=10**6, global_rate=10**6)
+    outbox.start()
+    client = Client(db, outbox)
+    fetches = []
+    try:
+        with contextlib.redirect_stdout(output):
+            cog = rl.RaydiumListener(client)
+            get_transactions = cog.rpc.get_transactions
+
+            async def timed(signatures):
+                started = time.perf_counter()
+                try:
+                    return await get_transactions(signatures)
+                finally:
+                    fetches.append((time.perf_counter() - started, len(signatures)))
+            cog.rpc.get_transactions = timed
+
+            started_at, finished_at, sent_at = await receive()
+            while cog.frames < len(frames):
+                await asyncio.sleep(0.001)
+            handled_at = time.time()
+            deadline = time.monotonic() + 30 + expected * discord_limits
+            while len(client.channel.posts) < expected and time.monotonic() < deadline:
+                await asyncio.sleep(0.005)
+            await cog.cog_unload()
+    finally:
+        await outbox.close()
+        await db.close()
+        connection.send("done")
+        http_requests = await receive()
+        process.join()
+
+    posts = client.channel.posts
+    signatures = [announced.get(description.rsplit("/", 1)[-1]) for _, description in posts]
+    latencies = [(posted - sent_at[signature]) * 1000 for (posted, _), signature in zip(posts, signatures) if signature]
+    in_order = signatures == sorted(signatures, key=lambda signature: sent_at.get(signature, 0))
+    recorded = frames[-1][0] - frames[0][0]
+    label = "max speed" if not speed else f"{speed:g}x"
+
+    print(f"replayed {len(frames):,} frames ({expected} pool inits) at {label} in {finished_at - started_at:.2f}s "
+          f"(recorded over {recorded:.1f}s)")
+    print(f"listener: {cog.frames / (handled_at - started_at):,.0f} frames/s handled, "
+          f"{cog.skipped:,} skipped without decoding, {cog.dropped} candidates dropped")
+    if fetches:
+        print("getTransaction: {} signatures in {} batch requests ({} HTTP requests in all), latency p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms".format(
+            sum(size for _, size in fetches), len(fetches), http_requests, *(latency * 1000 for latency in percentiles([l for l, _ in fetches]))))
+    print("end to end, frame sent to channel.send: p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+        *percentiles(latencies), max(latencies, default=0)))
+    stages = cog.latency.stats()
+    print("the cog's own /pool_latency, p50/p95: " + ", ".join(
+        f"{stage} {stages[stage]['p50'] * 1000:.1f}/{stages[stage]['p95'] * 1000:.1f} ms" for stage in ("fetch", "post", "listener")))
+    print(f"{len(posts)}/{expected} pools posted, {'in' if in_order else 'OUT OF'} notification order")
+    if len(posts) < expected or not in_order:
+        print("listener output:\n" + "\n".join(output.getvalue().splitlines()[-40:]))
+        sys.exit(1)
+
+
+def speed_arg(value):
+    return 0.0 if value == "max" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    recorder = commands.add_parser("record", help="record the node at RPC_URL/WS_URL")
+    recorder.add_argument("file")
+    recorder.add_argument("--seconds", type=float, default=300)
+    synth = commands.add_parser("synth", help="write a recording of made-up traffic")
+    synth.add_argument("file")
+    synth.add_argument("--frames", type=int, default=50_000)
+    synth.add_argument("--pools", type=int, default=100)
+    synth.add_argument("--rate", type=float, default=2000, help="frames per second")
+    server = commands.add_parser("serve", help="replay a recording to whatever connects")
+    server.add_argument("file")
+    server.add_argument("--speed", type=speed_arg, default=1.0, help="1, 10, ... or max")
+    bencher = commands.add_parser("bench", help="replay a recording into the cog and time it")
+    bencher.add_argument("file")
+    bencher.add_argument("--speed", type=speed_arg, default=0.0, help="1, 10, ... or max (default)")
+    bencher.add_argument("--rpc-latency", type=float, default=0, help="ms the stand-in waits per RPC request")
+    bencher.add_argument("--discord-limits", action="store_true", help="keep the outbox's real rate limits")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        asyncio.run(record(args.file, args.seconds))
+    elif args.command == "synth":
+        synthesize(args.file, args.frames, args.pools, args.rate)
+    elif args.command == "serve":
+        asyncio.run(serve(args.file, args.speed))
+    else:
+        asyncio.run(bench(args.file, args.speed, args.rpc_latency / 1000, args.discord_limits))
+
+
+if __name__ == "__main__":
+    main()
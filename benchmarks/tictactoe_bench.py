@@ -0,0 +1,171 @@
+"""Micro-benchmark: TicTacToe button callback with the precomputed tables.
+
+Checks the WINNERS table against the old nested-list win check on every
+reachable board and plays every possible game against the perfect bot to make
+sure it never loses. Then it times TicTacToeButton.callback over random games
+against the bot, once with the table lookup and once with the old win check
+patched back in. Run from the repo root:
+
+    python benchmarks/tictactoe_bench.py [games]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the cog reads its config on import, the values don't matter here
+for var in ("GUILD_ID", "TTT_MAX_USER_POINTS", "TTT_TOTAL_DISTRIBUTION_LIMIT", "TTT_POINTS_PER_WIN"):
+    os.environ.setdefault(var, "1")
+
+import cogs.games.tictactoe as tictactoe  # noqa: E402
+from cogs.games.tictactoe import TicTacToe  # noqa: E402
+from cogs.games.tictactoe_table import X, O, TIE, POW3, MARKS, WINNERS, BEST_MOVES  # noqa: E402
+from utils.game_sessions import GameSessions  # noqa: E402
+from fake_discord import Member, Message, Interaction  # noqa: E402
+
+
+# the win check as it was before the tables
+def legacy_check_board_winner(self):
+    for across in self.board:
+        value = sum(across)
+        if value == 3:
+            return self.O
+        elif value == -3:
+            return self.X
+
+    for line in range(3):
+        value = self.board[0][line] + self.board[1][line] + self.board[2][line]
+        if value == 3:
+            return self.O
+        elif value == -3:
+            return self.X
+
+    diag = self.board[0][2] + self.board[1][1] + self.board[2][0]
+    if diag == 3:
+        return self.O
+    elif diag == -3:
+        return self.X
+    diag = self.board[0][0] + self.board[1][1] + self.board[2][2]
+    if diag == 3:
+        return self.O
+    elif diag == -3:
+        return self.X
+
+    if all(i != 0 for row in self.board for i in row):
+        return self.Tie
+    return None
+
+
+class Board:
+    X, O, Tie = X, O, TIE
+
+    def __init__(self, board):
+        self.board = board
+
+
+def reachable(board=None, state=0, player=X, seen=None):
+    """Every board that can come up in a game, with its code."""
+    board = board or [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
+    seen = {} if seen is None else seen
+    if state in seen:
+        return seen
+    seen[state] = [row[:] for row in board]
+    if WINNERS[state] is not None:
+        return seen
+    for cell in range(9):
+        y, x = divmod(cell, 3)
+        if not board[y][x]:
+            board[y][x] = player
+            reachable(board, state + MARKS[player] * POW3[cell], -player, seen)
+            board[y][x] = 0
+    return seen
+
+
+def check_tables():
+    boards = reachable()
+    for state, board in boards.items():
+        assert WINNERS[state] == legacy_check_board_winner(Board(board)), board
+
+    def never_loses(state, bot, to_move):
+        winner = WINNERS[state]
+        if winner is not None:
+            return winner != -bot
+        if to_move == bot:
+            cell = BEST_MOVES[state]
+            return never_loses(state + MARKS[bot] * POW3[cell], bot, -to_move)
+        return all(
+            never_loses(state + MARKS[to_move] * POW3[cell], bot, -to_move)
+            for cell in range(9) if (state // POW3[cell]) % 3 == 0
+        )
+
+    assert never_loses(0, X, X) and never_loses(0, O, X), 'the perfect bot lost a game'
+    return len(boards)
+
+
+class Cog:
+    def __init__(self):
+        self.client = None
+        self.sessions = GameSessions(600)
+
+    def game_over(self, view):
+        pass
+
+
+async def time_callbacks(games):
+    cog = Cog()
+    human, bot = Member(1), Member(2)
+    rng = random.Random(1)
+    latencies = []
+    results = {X: 0, O: 0, TIE: 0}
+    for _ in range(games):
+        view = TicTacToe(cog, human, bot, vs_bot=True)
+        while view.check_board_winner() is None:
+            free = [button for button in view.children if not button.disabled]
+            button = rng.choice(free)
+            started = time.perf_counter()
+            await button.callback(Interaction(human, Message()))
+            latencies.append(time.perf_counter() - started)
+        results[view.check_board_winner()] += 1
+    latencies.sort()
+    return latencies, results
+
+
+def report(label, latencies):
+    print("{:<22} p50 {:6.1f} us   p95 {:6.1f} us   p99 {:6.1f} us".format(
+        label, *(latencies[int(len(latencies) * q)] * 1e6 for q in (0.5, 0.95, 0.99))))
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"tables match the old win check on all {check_tables()} reachable boards, the perfect bot never loses")
+
+    checks = [Board(board) for board in reachable().values()]
+    states = list(reachable().keys())
+    started = time.perf_counter()
+    for board in checks * 20:
+        legacy_check_board_winner(board)
+    legacy = time.perf_counter() - started
+    started = time.perf_counter()
+    for state in states * 20:
+        WINNERS[state]
+    table = time.perf_counter() - started
+    print(f"win check: {len(checks) * 20 / legacy:,.0f}/s nested lists, {len(states) * 20 / table:,.0f}/s table ({legacy / table:.1f}x)")
+
+    latencies, results = asyncio.run(time_callbacks(games))
+    report("callback, table:", latencies)
+    print(f"  {games} games against the bot (handicap {tictactoe.TTT_BOT_HANDICAP}): "
+          f"human won {results[X]}, bot won {results[O]}, {results[TIE]} ties")
+
+    table_check = TicTacToe.check_board_winner
+    TicTacToe.check_board_winner = legacy_check_board_winner
+    try:
+        latencies, _ = asyncio.run(time_callbacks(games))
+    finally:
+        TicTacToe.check_board_winner = table_check
+    report("callback, old check:", latencies)
+
+
+if __name__ == '__main__':
+    main()
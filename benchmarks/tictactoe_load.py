@@ -0,0 +1,168 @@
+"""Load test: thousands of TicTacToe games running at once.
+
+Starts the games through the real /tictactoe command and plays them by calling
+the button callbacks with stand-in interactions, interleaving moves across all
+games. Players sit in two games each, so any state shared between games shows
+up as wrong turns or wrong winners. Every finished game is checked against its
+move list, the points the settlement worker awarded against the db, and idle games against the
+session registry's expiry. Run from the repo root:
+
+    python benchmarks/tictactoe_load.py [games]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the cogs read their config on import, keep the caps out of the way
+for var, value in (("GUILD_ID", "1"), ("TTT_MAX_USER_POINTS", "1000000000"), ("TTT_TOTAL_DISTRIBUTION_LIMIT", "1000000000"),
+                   ("TTT_POINTS_PER_WIN", "10"), ("MAX_DAILY_POINTS", "1000000000"), ("TTT_MAX_GAMES", "1000000")):
+    os.environ.setdefault(var, value)
+
+from cogs.games.tictactoe import TictactoeCog, TTT_POINTS_PER_WIN, TTT_MAX_GAMES_PER_USER  # noqa: E402
+from utils.database import Database  # noqa: E402
+from utils.budget import DailyBudget  # noqa: E402
+from utils.points_ledger import PointsLedger  # noqa: E402
+from utils.user_cache import UserCache  # noqa: E402
+from utils.settlement import Settlement  # noqa: E402
+from fake_discord import Member, Message, Interaction  # noqa: E402
+
+LINES = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)]
+
+
+class Client:
+    """The bits of the bot the cog uses."""
+
+    def __init__(self, db):
+        self.db = db
+        self.budget = DailyBudget(db)
+        self.ledger = PointsLedger(db)
+        self.user_cache = UserCache(db, self.ledger)
+        self.settlement = Settlement(db, self.budget, self.user_cache)
+        self.user = Member(0)  # the bot itself
+
+    def get_user(self, user_id):
+        return None  # no DMs
+
+
+def reference_winner(cells):
+    for a, b, c in LINES:
+        if cells[a] and cells[a] == cells[b] == cells[c]:
+            return cells[a]
+    return 'tie' if all(cells) else None
+
+
+async def start_game(cog, player1, player2):
+    message = Message()
+    interaction = Interaction(player1, message)
+    await cog.tictactoe.callback(cog, interaction, player2)
+    return cog.sessions.get(message.id), message, interaction
+
+
+async def play(view, message, latencies, rng):
+    players = (view.player1, view.player2)
+    cells = [None] * 9
+    turn = 0
+    while True:
+        # every so often the wrong player clicks, it must be turned away
+        if rng.random() < 0.2:
+            interaction = Interaction(players[1 - turn], message)
+            free = [i for i in range(9) if cells[i] is None]
+            button = view.children[free[0] % 3 * 3 + free[0] // 3]
+            await button.callback(interaction)
+            assert interaction.response.ephemeral == ["It's not your Turn!"], 'a wrong-turn click was accepted'
+
+        cell = rng.choice([i for i in range(9) if cells[i] is None])
+        x, y = cell % 3, cell // 3
+        button = view.children[x * 3 + y]  # buttons are added column by column
+        interaction = Interaction(players[turn], message)
+        started = time.perf_counter()
+        await button.callback(interaction)
+        latencies.append(time.perf_counter() - started)
+        cells[cell] = 'XO'[turn]
+        result = reference_winner(cells)
+        if result is not None:
+            return result, message.content, players
+        turn = 1 - turn
+        await asyncio.sleep(0)  # let the other games move
+
+
+async def run(games):
+    directory = tempfile.mkdtemp()
+    db = Database(os.path.join(directory, 'load.db'))
+    await db.connect()
+    await db.init_db()
+    client = Client(db)
+    await client.budget.load()
+    client.ledger.start()
+    client.settlement.start()
+    cog = TictactoeCog(client)
+    rng = random.Random(1)
+
+    try:
+        players = [Member(user_id) for user_id in range(1, games + 1)]
+        started = time.perf_counter()
+        sessions = []
+        for n in range(games):
+            # everyone plays two games at once, one as X and one as O
+            sessions.append(await start_game(cog, players[n], players[(n + 1) % games]))
+        assert len(cog.sessions) == games and cog.running == games
+
+        # per-user cap: top one player up to the limit, the next challenge is refused
+        extra = [await start_game(cog, players[0], Member(games + 1 + n)) for n in range(TTT_MAX_GAMES_PER_USER - 2)]
+        refused, message, interaction = await start_game(cog, players[0], Member(games * 10))
+        assert refused is None and interaction.response.ephemeral, 'the per-user cap was not enforced'
+        for view, message, _ in extra:
+            view.finish()
+
+        latencies = []
+        results = await asyncio.gather(*(play(view, message, latencies, random.Random(n)) for n, (view, message, _) in enumerate(sessions)))
+        elapsed = time.perf_counter() - started
+        settlement = client.settlement.stats()
+        await client.settlement.close()  # settles whatever is still queued
+        settlement = client.settlement.stats() | {'queued_at_end': settlement['queued']}
+
+        expected = {}
+        for result, content, (player1, player2) in results:
+            if result == 'tie':
+                assert content == "It's a tie!", content
+            else:
+                winner = player1 if result == 'X' else player2
+                assert content == f'{winner.mention} **{result}** won!', content
+                expected[winner.id] = expected.get(winner.id, 0) + TTT_POINTS_PER_WIN
+        rows = dict(await db.fetchall("SELECT user_id, points FROM users WHERE points > 0"))
+        assert rows == expected, 'awarded points do not match the winners'
+        assert len(cog.sessions) == 0 and cog.running == 0 and not cog.games_per_user, 'finished games were not released'
+
+        # idle games are expired by the registry
+        cog.sessions.idle_timeout = 0.2
+        idle = [await start_game(cog, Member(-n), Member(-n - games)) for n in range(1, 1001)]
+        await asyncio.sleep(0.5)
+        assert len(cog.sessions) == 0 and cog.running == 0, 'idle games were not expired'
+        assert all(message.content == "Game ended, nobody moved in time!" for _, message, _ in idle)
+
+        latencies.sort()
+        ties = sum(result == 'tie' for result, _, _ in results)
+        print(f"{games} concurrent games ({ties} ties) finished correctly in {elapsed:.2f}s, {games / elapsed:,.0f} games/s")
+        print("move callback latency: p50 {:.2f} ms, p95 {:.2f} ms, p99 {:.2f} ms".format(
+            *(latencies[int(len(latencies) * q)] * 1000 for q in (0.5, 0.95, 0.99))))
+        print("settled {settled} wins off the interaction path ({queued_at_end} still queued when the games ended), "
+              "lag p50 {lag_p50:.2f}s, p95 {lag_p95:.2f}s".format(**settlement))
+        print(f"1000 idle games expired by one timer, {cog.sessions.expired} expired in total")
+    finally:
+        await cog.cog_unload()
+        await client.settlement.close()
+        await client.ledger.close()
+        await db.close()
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    asyncio.run(run(games))
+
+
+if __name__ == '__main__':
+    main()
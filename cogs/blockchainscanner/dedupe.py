@@ -0,0 +1,71 @@
+import os
+import math
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# signatures each generation of the filter holds, the listener always remembers at least this many
+DEDUPE_CAPACITY = int(os.getenv("RAYDIUM_DEDUPE_CAPACITY", "1000000"))
+# chance that a new signature is taken for one we've already seen
+DEDUPE_FP_RATE = float(os.getenv("RAYDIUM_DEDUPE_FP_RATE", "0.000001"))
+
+
+class SignatureFilter:
+    """Remembers recently seen signatures in a fixed amount of memory.
+
+    A rotating Bloom filter: signatures go into the current generation and once
+    it holds ``capacity`` of them it becomes the previous generation and a fresh
+    one takes over. Lookups check both, so the last ``capacity`` signatures are
+    always caught while memory stays flat however long the listener runs. Each
+    generation is sized for half of ``fp_rate`` since a lookup can hit either.
+    """
+
+    def __init__(self, capacity=DEDUPE_CAPACITY, fp_rate=DEDUPE_FP_RATE):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.bits = math.ceil(-capacity * math.log(fp_rate / 2) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._size = (self.bits + 7) // 8
+        self._current = bytearray(self._size)
+        self._previous = bytearray(self._size)
+        self._count = 0
+        self.rotations = 0
+
+    def _hash(self, signature):
+        # double hashing: the two 32-bit halves of the str hash give every position
+        h = hash(signature)
+        return h & 0xffffffff, (h >> 32) & 0xffffffff | 1
+
+    def _has(self, generation, first, second):
+        bits = self.bits
+        position = first % bits
+        for _ in range(self.hashes):
+            if not generation[position >> 3] & (1 << (position & 7)):
+                return False
+            position = (position + second) % bits
+        return True
+
+    def __contains__(self, signature):
+        first, second = self._hash(signature)
+        return self._has(self._current, first, second) or self._has(self._previous, first, second)
+
+    def add(self, signature):
+        """Record the signature, returns False if it had been seen already."""
+        first, second = self._hash(signature)
+        if self._has(self._current, first, second) or self._has(self._previous, first, second):
+            return False
+        current, bits = self._current, self.bits
+        position = first % bits
+        for _ in range(self.hashes):
+            current[position >> 3] |= 1 << (position & 7)
+            position = (position + second) % bits
+        self._count += 1
+        if self._count >= self.capacity:
+            self._previous, self._current = self._current, bytearray(self._size)
+            self._count = 0
+            self.rotations += 1
+        return True
+
+    def memory(self):
+        """Bytes held by the filter, the same from the first signature to the last."""
+        return 2 * self._size
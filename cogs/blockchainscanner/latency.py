@@ -0,0 +1,49 @@
+import os
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# announced pools each stage's percentiles are taken over
+POOL_LATENCY_SAMPLES = int(os.getenv("RAYDIUM_LATENCY_SAMPLES", "1000"))
+
+# stage -> (what it covers, start, end)
+STAGES = {
+    'chain': ("block time to websocket notification", 'block_time', 'received_at'),
+    'fetch': ("notification to getTransaction result, queue wait included", 'received_at', 'fetched_at'),
+    'post': ("transaction to channel.send done, ordering and outbox included", 'fetched_at', 'sent_at'),
+    'listener': ("notification to channel.send done", 'received_at', 'sent_at'),
+    'total': ("block time to channel.send done", 'block_time', 'sent_at'),
+}
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class PoolLatency:
+    """Rolling latencies of every stage between a pool init landing and its post.
+
+    Timestamps are wall clock seconds so they compare with the block time.
+    Each stage keeps its last ``samples`` values and percentiles are worked out
+    when asked for. Block times only have second resolution, so the chain and
+    total stages are accurate to about a second, the others to the millisecond.
+    """
+
+    def __init__(self, samples=POOL_LATENCY_SAMPLES):
+        self._stages = {stage: deque(maxlen=samples) for stage in STAGES}
+        self.recorded = 0
+
+    def record(self, block_time, received_at, fetched_at, sent_at):
+        times = {'block_time': block_time, 'received_at': received_at, 'fetched_at': fetched_at, 'sent_at': sent_at}
+        for stage, (_, start, end) in STAGES.items():
+            if times[start] is not None and times[end] is not None:
+                self._stages[stage].append(max(0.0, times[end] - times[start]))
+        self.recorded += 1
+
+    def stats(self):
+        """stage -> {'samples', 'p50', 'p95', 'p99', 'max'} in seconds, over the last samples."""
+        stats = {}
+        for stage, values in self._stages.items():
+            values = sorted(values)
+            stats[stage] = {'samples': len(values), 'max': values[-1] if values else 0.0}
+            for quantile in QUANTILES:
+                stats[stage][f'p{round(quantile * 100)}'] = values[min(len(values) - 1, int(len(values) * quantile))] if values else 0.0
+        return stats
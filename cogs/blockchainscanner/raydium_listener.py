@@ -1,86 +1,369 @@
+import re
+import time
+import random
+import asyncio
+import itertools
 import websockets
 import json
-from solana.rpc.api import Client
-from solders.pubkey import Pubkey
-from solders.signature import Signature
+from functools import partial
+from collections import OrderedDict
 import pandas as pd
 from tabulate import tabulate
+import discord
 from discord.ext import commands
-from discord import Embed
+from discord import app_commands, Embed
 import os
 from dotenv import load_dotenv
+from cogs.blockchainscanner.dedupe import SignatureFilter
+from cogs.blockchainscanner.rpc import BatchRpcClient
+from cogs.blockchainscanner.latency import PoolLatency, STAGES
+
+try:
+    # optional, decodes the notifications that make it past the prefilter faster
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 load_dotenv()
 
-RPC_URL = "http://86.109.8.241:8899/"
-WS_URL = "ws://86.109.8.241:8900/"
+# the node the listener talks to, point these at benchmarks/raydium_replay.py to run it offline
+RPC_URL = os.getenv("RPC_URL") or "http://86.109.8.241:8899/"
+WS_URL = os.getenv("WS_URL") or "ws://86.109.8.241:8900/"
+# candidate pool signatures waiting to be fetched, more than this during a burst are dropped
+QUEUE_SIZE = int(os.getenv("RAYDIUM_QUEUE_SIZE", "1000"))
+# getTransaction batches in flight at once, and most signatures looked up per batch
+FETCHERS = int(os.getenv("RAYDIUM_FETCHERS", "4"))
+BATCH_SIZE = int(os.getenv("RAYDIUM_BATCH_SIZE", "20"))
+# parsed transactions remembered by signature, so a replayed or backfilled signature costs no RPC call
+POOL_CACHE_SIZE = int(os.getenv("RAYDIUM_POOL_CACHE_SIZE", "10000"))
+RAYDIUM_PROGRAM_ID = "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8"
+WSOL_MINT = "So11111111111111111111111111111111111111112"
+# where the initialize2 instruction keeps the pool and its two mints
+POOL_ACCOUNT, TOKEN0_ACCOUNT, TOKEN1_ACCOUNT = 4, 8, 9
+# seconds between reconnect attempts, doubling up to the max
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+# most signatures looked at when backfilling the gap after a reconnect
+BACKFILL_MAX = int(os.getenv("RAYDIUM_BACKFILL_MAX", "5000"))
+BACKFILL_PAGE_SIZE = 1000
+# seconds between saves of the last processed slot
+SLOT_SAVE_INTERVAL = 5.0
+# print every websocket frame
+DEBUG = os.getenv("RAYDIUM_DEBUG", "0") not in ("0", "false", "False")
+POOL_MARKER = "initialize2"
+# the context slot sits near the start of a notification, no need to decode the rest
+SLOT_PATTERN = re.compile(r'"slot":\s*(\d+)')
+SLOT_SCAN_CHARS = 256
+
+def parse_pool(transaction):
+    """(pool, token0, token1, block time) of a jsonParsed Raydium pool init, None for anything else."""
+    # backfilled signatures come without their logs, most of them are swaps
+    logs = (transaction.get('meta') or {}).get('logMessages') or []
+    if not any(POOL_MARKER in message for message in logs):
+        return None
+    for instruction in transaction['transaction']['message']['instructions']:
+        if instruction.get('programId') == RAYDIUM_PROGRAM_ID:
+            accounts = instruction.get('accounts') or []
+            if len(accounts) > TOKEN1_ACCOUNT:
+                return accounts[POOL_ACCOUNT], accounts[TOKEN0_ACCOUNT], accounts[TOKEN1_ACCOUNT], transaction.get('blockTime')
+    return None
 
 class RaydiumListener(commands.Cog):
+    """Posts new Raydium pools to Discord.
+
+    The websocket loop only filters log notifications and queues the signatures
+    of pool inits. It reconnects with jittered backoff whenever the socket drops,
+    and backfills the missed window from the last processed slot with
+    getSignaturesForAddress, off to the side of the live pipeline. A pool of
+    fetchers drains the queue a batch at a time and looks the transactions up
+    with one JSON-RPC batch request each, and a single poster announces the
+    pools in the order their notifications arrived, so a burst of new pools
+    costs a few round trips without ever blocking the event loop.
+    Every post records how long each stage took, see /pool_latency.
+    """
+
     def __init__(self, bot):
-        self.bot = bot 
+        self.bot = bot
         self.channel_id = os.getenv("DISCORD_CHANNEL_ID")
-        self.wallet_address = "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8"
-        self.seen_signatures = set()
-        self.solana_client = Client(RPC_URL)
-        self.bot.loop.create_task(self.run_listener())
-
-    def getTokens(self, str_signature):
-        signature = Signature.from_string(str_signature)
-        transaction = self.solana_client.get_transaction(signature, encoding="jsonParsed",
-                                                         max_supported_transaction_version=0).value
-        instruction_list = transaction.transaction.transaction.message.instructions
-        for instructions in instruction_list:
-            if instructions.program_id == Pubkey.from_string(self.wallet_address):
-                print("============NEW POOL DETECTED====================")
-                Token0 = instructions.accounts[8]
-                Token1 = instructions.accounts[9]
-                if Token0 == "So11111111111111111111111111111111111111112":
-                    return Token1
-                data = {'Token_Index': ['Token0', 'Token1'],
-                        'Account Public Key': [Token0, Token1]}
-                df = pd.DataFrame(data)
-                table = tabulate(df, headers='keys', tablefmt='fancy_grid')
-                print(table)
-                return Token0 
+        self.wallet_address = RAYDIUM_PROGRAM_ID
+        self.seen_signatures = SignatureFilter()
+        self.rpc = BatchRpcClient(RPC_URL, connections=FETCHERS)
+        self.pools = OrderedDict()  # signature -> (pool, token0, token1, block time) or None, least recently used first
+        self.latency = PoolLatency()
+        self.candidates = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = 0
+        self._sequence = itertools.count()
+        self._results = {}  # sequence number -> token or None, until it's posted
+        self._unposted = {}  # sequence number -> slot of each queued candidate, until it's posted
+        self._next_result = 0
+        self._result_ready = asyncio.Event()
+        self.last_slot = None
+        self._saved_slot = None
+        self._slot_saved_at = 0
+        self._backfill = None
+        self._backfill_since = None  # start of a backfill that hasn't got through yet
+        self.frames = 0
+        self.skipped = 0
+        self.tasks = [self.bot.loop.create_task(self.run_listener()), self.bot.loop.create_task(self.post_pools())]
+        self.tasks += [self.bot.loop.create_task(self.fetch_pools()) for _ in range(FETCHERS)]
+
+    async def cog_unload(self):
+        tasks = [*self.tasks, self._backfill] if self._backfill else self.tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.save_last_slot()
+        await self.rpc.close()
+
+    async def getTokens(self, signatures):
+        """(token, block time) of each signature's new pool, None for anything that isn't one.
+
+        Signatures that aren't cached are looked up together in one batch request.
+        """
+        missing = [signature for signature in signatures if signature not in self.pools]
+        if missing:
+            transactions = await self.rpc.get_transactions(missing)
+            for signature, transaction in zip(missing, transactions):
+                if transaction is None:
+                    continue  # not finalized on the node yet, nothing worth remembering
+                pool = parse_pool(transaction)
+                self._remember(signature, pool)
+                if pool:
+                    print("============NEW POOL DETECTED====================")
+                    data = {'Account': ['Pool', 'Token0', 'Token1'], 'Account Public Key': list(pool[:3])}
+                    print(tabulate(pd.DataFrame(data), headers='keys', tablefmt='fancy_grid'))
+        tokens = []
+        for signature in signatures:
+            pool = self.pools.get(signature)
+            if pool:
+                self.pools.move_to_end(signature)
+                _, token0, token1, block_time = pool
+                pool = (token1 if token0 == WSOL_MINT else token0), block_time
+            tokens.append(pool)
+        return tokens
+
+    def _remember(self, signature, pool):
+        self.pools[signature] = pool
+        if len(self.pools) > POOL_CACHE_SIZE:
+            self.pools.popitem(last=False)
 
     async def send_discord_message(self, content):
         channel = self.bot.get_channel(int(self.channel_id))
         if channel is None:
             return
-        
+
         embed = Embed(title="New Pool Detected", description=f"Dexscreener: {content}", color=0x00ff00)
-        await channel.send(embed=embed)
+        return await self.bot.outbox.submit(('channel', channel.id), partial(channel.send, embed=embed))
+
+    def queue_candidate(self, signature, received_at, slot=None):
+        if self.candidates.full():
+            self.dropped += 1
+            print(f"Candidate queue is full, dropped {signature}")
+            return
+        sequence = next(self._sequence)
+        if slot is not None:
+            self._unposted[sequence] = slot
+        self.candidates.put_nowait((sequence, signature, received_at))
+
+    async def fetch_pools(self):
+        while True:
+            # take whatever else is already waiting, up to a batch
+            batch = [await self.candidates.get()]
+            while len(batch) < BATCH_SIZE and not self.candidates.empty():
+                batch.append(self.candidates.get_nowait())
+            signatures = [signature for _, signature, _ in batch]
+            pools = [None] * len(batch)
+            try:
+                pools = await self.getTokens(signatures)
+            except Exception as error:
+                print(f"An error occurred while fetching transactions {signatures} {error!r}")
+            finally:
+                fetched_at = time.time()
+                for (sequence, _, received_at), pool in zip(batch, pools):
+                    self._results[sequence] = pool and (*pool, received_at, fetched_at)
+                self._result_ready.set()
+
+    async def post_pools(self):
+        """Announce fetched pools in the order their notifications arrived."""
+        while True:
+            await self._result_ready.wait()
+            self._result_ready.clear()
+            while self._next_result in self._results:
+                sequence = self._next_result
+                result = self._results.pop(sequence)
+                self._next_result += 1
+                if result:
+                    token, block_time, received_at, fetched_at = result
+                    link = f"https://dexscreener.com/solana/{token}"
+                    try:
+                        message = await self.send_discord_message(link)
+                    except Exception as error:
+                        print(f"An error occurred while posting pool {token} {error!r}")
+                        message = None
+                    if message is not None and received_at is not None:
+                        # backfilled pools are late by design, they'd only skew the numbers
+                        self.latency.record(block_time, received_at, fetched_at, time.time())
+                self._unposted.pop(sequence, None)
 
     async def run_listener(self):
         await self.bot.wait_until_ready()
-        uri = WS_URL
-        async with websockets.connect(uri) as websocket:
-            await websocket.send(json.dumps({
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "logsSubscribe",
-                "params": [
-                    {"mentions": [self.wallet_address]},
-                    {"commitment": "finalized"}
-                ]
-            }))
-            print("Subscription request sent.")
-            
-            async for response in websocket:
-                response_dict = json.loads(response)
-                print("Received message:", response_dict)  # Print received message for debugging
-                if 'params' in response_dict and 'result' in response_dict['params'] and 'value' in response_dict['params']['result']:
-                    signature = response_dict['params']['result']['value']['signature']
-                    if signature not in self.seen_signatures:
-                        self.seen_signatures.add(signature)
-                        log_messages_set = set(response_dict['params']['result']['value']['logs'])
-                        search = "initialize2"
-                        if any(search in message for message in log_messages_set):
-                            print(f"True, https://solscan.io/tx/{signature}")
-                            token0 = self.getTokens(signature)
-                            if token0:
-                                link = f"https://dexscreener.com/solana/{token0}"
-                                await self.send_discord_message(link)
+        await self.load_last_slot()
+        delay = RECONNECT_BASE_DELAY
+        while True:
+            try:
+                async with websockets.connect(WS_URL) as websocket:
+                    await websocket.send(json.dumps({
+                        "jsonrpc": "2.0",
+                        "id": 1,
+                        "method": "logsSubscribe",
+                        "params": [
+                            {"mentions": [self.wallet_address]},
+                            {"commitment": "finalized"}
+                        ]
+                    }))
+                    print("Subscription request sent.")
+                    if self.last_slot is not None:
+                        self.start_backfill(self.last_slot)
+
+                    async for response in websocket:
+                        delay = RECONNECT_BASE_DELAY  # the connection works, start over if it drops
+                        self.handle_message(response)
+                        if time.monotonic() - self._slot_saved_at >= SLOT_SAVE_INTERVAL:
+                            await self.save_last_slot()
+                print("Raydium websocket closed, reconnecting.")
+            except Exception as error:
+                print(f"An error occurred in the Raydium websocket {error!r}, reconnecting in about {delay:.0f}s.")
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def handle_message(self, response):
+        self.frames += 1
+        if DEBUG:
+            print("Received message:", response)
+        if POOL_MARKER not in response:
+            # nearly every frame is a swap: skip decoding it, only keep track of the slot
+            self.skipped += 1
+            match = SLOT_PATTERN.search(response, 0, SLOT_SCAN_CHARS)
+            if match:
+                self._track_slot(int(match.group(1)))
+            return
+
+        received_at = time.time()
+        response_dict = json_loads(response)
+        if 'params' in response_dict and 'result' in response_dict['params'] and 'value' in response_dict['params']['result']:
+            result = response_dict['params']['result']
+            slot = result.get('context', {}).get('slot')
+            self._track_slot(slot)
+            signature = result['value']['signature']
+            if any(POOL_MARKER in message for message in result['value']['logs']) and self.seen_signatures.add(signature):
+                print(f"True, https://solscan.io/tx/{signature}")
+                self.queue_candidate(signature, received_at, slot)
+
+    def _track_slot(self, slot):
+        if slot is not None and (self.last_slot is None or slot > self.last_slot):
+            self.last_slot = slot
+
+    def processed_slot(self):
+        """The slot a restart has to backfill from: nothing before it is still waiting to be posted."""
+        slots = [self.last_slot, self._backfill_since, *self._unposted.values()]
+        return min((slot for slot in slots if slot is not None), default=None)
+
+    async def load_last_slot(self):
+        row = await self.bot.db.fetchone("SELECT last_slot FROM listener_state WHERE name = ?", ('raydium',))
+        if row:
+            self.last_slot = self._saved_slot = row[0]
+
+    async def save_last_slot(self):
+        self._slot_saved_at = time.monotonic()
+        slot = self.processed_slot()
+        if slot is None or slot == self._saved_slot:
+            return
+        try:
+            await self.bot.db.execute(
+                "INSERT INTO listener_state (name, last_slot) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET last_slot = excluded.last_slot",
+                ('raydium', slot)
+            )
+            self._saved_slot = slot
+        except Exception as error:
+            print(f"An error occurred while saving the last Raydium slot {error!r}")
+
+    def start_backfill(self, since_slot):
+        if self._backfill_since is None or since_slot < self._backfill_since:
+            self._backfill_since = since_slot
+        if self._backfill is not None and not self._backfill.done():
+            # dropped again mid backfill: start over from the older start so one run covers both gaps,
+            # whatever it already got through is in seen_signatures and the pool cache
+            self._backfill.cancel()
+        self._backfill = asyncio.create_task(self.backfill(self._backfill_since))
+
+    async def backfill(self, since_slot):
+        """Post the pool inits we missed since ``since_slot``, oldest first.
+
+        The gap is mostly swaps (getSignaturesForAddress has no logs to filter
+        on), so it's looked up here one batch at a time and posted as found,
+        never through the live queue: live pools are neither dropped for lack
+        of room nor held behind the backfill in the poster's order.
+        """
+        missed = []
+        before = None
+        complete = True
+        try:
+            while len(missed) < BACKFILL_MAX:
+                page = await self.rpc.get_signatures_for_address(
+                    RAYDIUM_PROGRAM_ID, before=before, limit=min(BACKFILL_PAGE_SIZE, BACKFILL_MAX - len(missed))
+                )
+                if not page:
+                    break
+                missed.extend(status for status in page if status['slot'] >= since_slot)
+                if page[-1]['slot'] < since_slot:
+                    break
+                before = page[-1]['signature']
+        except Exception as error:
+            print(f"An error occurred while backfilling from slot {since_slot} {error!r}")
+            complete = False
+
+        # only marked as seen once looked up, a failed batch is picked up by the next backfill
+        signatures = list(dict.fromkeys(
+            status['signature'] for status in reversed(missed)
+            if status.get('err') is None and status['signature'] not in self.seen_signatures
+        ))
+        posted = 0
+        for start in range(0, len(signatures), BATCH_SIZE):
+            batch = signatures[start:start + BATCH_SIZE]
+            try:
+                pools = await self.getTokens(batch)
+            except Exception as error:
+                print(f"An error occurred while fetching backfilled transactions {batch} {error!r}")
+                complete = False
+                continue
+            for signature, pool in zip(batch, pools):
+                # not on the node yet, or the live listener got to it during the lookup
+                if signature not in self.pools or not self.seen_signatures.add(signature):
+                    continue
+                if pool:
+                    token, _ = pool
+                    try:
+                        await self.send_discord_message(f"https://dexscreener.com/solana/{token}")
+                        posted += 1
+                    except Exception as error:
+                        print(f"An error occurred while posting pool {token} {error!r}")
+        print(f"Backfilled {len(missed)} signatures since slot {since_slot}, checked {len(signatures)}, posted {posted} pools.")
+        # until then the saved slot stays at the start, so a restart goes over the gap again
+        if complete and self._backfill_since is not None and since_slot <= self._backfill_since:
+            self._backfill_since = None
+
+    @app_commands.command(name="pool_latency", description="How long new Raydium pools take to get posted.")
+    @app_commands.default_permissions(manage_guild=True)
+    async def pool_latency(self, interaction: discord.Interaction):
+        stats = self.latency.stats()
+        lines = [f"{self.latency.recorded} pools timed since startup, percentiles over the last {stats['listener']['samples']}:", "```"]
+        lines.append(f"{'stage':<9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for stage, row in stats.items():
+            lines.append(f"{stage:<9}" + "".join(f"{row[key]:>8.2f}s" for key in ('p50', 'p95', 'p99', 'max')))
+        lines.append("```")
+        lines += [f"**{stage}**: {description}" for stage, (description, _, _) in STAGES.items()]
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 async def setup(bot):
     await bot.add_cog(RaydiumListener(bot))
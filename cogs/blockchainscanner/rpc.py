@@ -0,0 +1,101 @@
+import os
+import json
+import random
+import asyncio
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# seconds per RPC request, and how many times a failed request is retried
+RPC_TIMEOUT = float(os.getenv("RAYDIUM_RPC_TIMEOUT", "10"))
+RPC_RETRIES = 2
+# kept-alive connections to the node
+RPC_CONNECTIONS = int(os.getenv("RAYDIUM_FETCHERS", "4"))
+
+
+class RpcError(Exception):
+    pass
+
+
+class BatchRpcClient:
+    """Solana JSON-RPC over one pooled HTTP session.
+
+    ``get_transactions`` looks up any number of signatures with a single batch
+    request, so a burst of candidates costs one round trip instead of one each.
+    Responses are plain jsonParsed dicts, nothing is wrapped in solders types.
+    """
+
+    def __init__(self, url, timeout=RPC_TIMEOUT, retries=RPC_RETRIES, connections=RPC_CONNECTIONS):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.connections = connections
+        self._session = None
+        self.requests = 0
+        self.calls = 0
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                json_serialize=json.dumps,
+            )
+        return self._session
+
+    async def _post(self, payload):
+        """POST the payload, retrying with jittered backoff, and return the decoded body."""
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._get_session().post(self.url, json=payload) as response:
+                    response.raise_for_status()
+                    body = await response.json(content_type=None)
+                self.requests += 1
+                return body
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.5 * (attempt + 1) * random.uniform(0.5, 1.5))
+
+    async def call(self, method, params):
+        self.calls += 1
+        body = await self._post({"jsonrpc": "2.0", "id": 0, "method": method, "params": params})
+        if "error" in body:
+            raise RpcError(f"{method}: {body['error']}")
+        return body.get("result")
+
+    async def get_transactions(self, signatures):
+        """The jsonParsed transaction of each signature, None where the node has none."""
+        if not signatures:
+            return []
+        self.calls += len(signatures)
+        config = {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0, "commitment": "finalized"}
+        body = await self._post([
+            {"jsonrpc": "2.0", "id": index, "method": "getTransaction", "params": [signature, config]}
+            for index, signature in enumerate(signatures)
+        ])
+        if isinstance(body, dict):
+            # the whole batch was refused, e.g. batches disabled on the node
+            raise RpcError(f"getTransaction batch: {body.get('error')}")
+        transactions = [None] * len(signatures)
+        for item in body:
+            # batch responses can come back in any order
+            index = item.get("id")
+            if not isinstance(index, int) or not 0 <= index < len(signatures):
+                continue
+            if "error" in item:
+                print(f"An error occurred while fetching transaction {signatures[index]} {item['error']}")
+            else:
+                transactions[index] = item.get("result")
+        return transactions
+
+    async def get_signatures_for_address(self, address, before=None, limit=1000):
+        config = {"limit": limit, "commitment": "finalized"}
+        if before is not None:
+            config["before"] = before
+        return await self.call("getSignaturesForAddress", [address, config]) or []
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -1,13 +1,16 @@
 import os
-import asyncio
 import random
+import asyncio
+import sqlite3
 from collections import Counter
+from functools import partial
 from datetime import datetime, time
+from time import monotonic
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from dotenv import load_dotenv
-import aiosqlite
+from utils.outbox import BULK
 
 
 def check_env_vars():
@@ -31,7 +34,6 @@ load_dotenv()
 check_env_vars()
 
 GUILD_ID = int(os.getenv('GUILD_ID'))
-DB_FILE = 'meme_bot.db'
 REMINDER_CHANNEL_ID = int(os.getenv('REMINDER_CHANNEL_ID'))
 REMINDER_TIMES = [time(hour=10, minute=0), time(hour=22, minute=0)]  # 10:00 AM and 10:00 PM UTC
 
@@ -39,6 +41,8 @@ MAX_DAILY_POINTS = int(os.getenv("MAX_DAILY_POINTS"))
 MAX_USER_POINTS = int(os.getenv("MAX_USER_POINTS"))
 TOTAL_DISTRIBUTION_LIMIT = int(os.getenv("TOTAL_DISTRIBUTION_LIMIT"))
 POINTS_PER_MESSAGE = int(os.getenv("POINTS_PER_MESSAGE"))
+# seconds a user has to wait after earning points before the next message counts (optional)
+CHAT_COOLDOWN_SECONDS = float(os.getenv("CHAT_COOLDOWN_SECONDS", "0"))
 DELAY_24_HOURS_IN_SECONDS = 24 * 3600
 
 class PickWinners(commands.Cog):
@@ -47,111 +51,94 @@ class PickWinners(commands.Cog):
         self.activity_counter = Counter()
         self.wallet_addresses = {}
         self.last_messages = {}
-        self.channel_deletion_tasks = {}
-        self.bot.loop.create_task(self.init_db())
+        self.bot.timers.register('delete_channel', self.delete_channels)
+        self.bot.timers.register('delete_dm', self.delete_dms)
+        self.bot.budget.set_limit('chat', TOTAL_DISTRIBUTION_LIMIT)
+        # in-memory pre-filter, lets on_message drop messages that can't earn anything without any I/O
+        self.capped_users = set()
+        self.cooldowns = {}
+        self.budget_spent = False
+        self._roll_date()
+        self.bot.cron.register('chat_date_rollover', [time(hour=0, minute=0)], self._roll_date)
+        self.bot.cron.register('wallet_reminder', REMINDER_TIMES, self.remind_wallet_submission)
         self.scoreboard_refresh.start() # pylint: disable=no-member
-        self.remind_wallet_submission.start() # pylint: disable=no-member
-
-    async def init_db(self):
-        async with aiosqlite.connect(DB_FILE) as db:
-            await db.execute('''CREATE TABLE IF NOT EXISTS users (
-                                user_id INTEGER PRIMARY KEY,
-                                points INTEGER DEFAULT 0,
-                                wallet_address TEXT,
-                                last_activity DATE)''')
-            await db.execute('''CREATE TABLE IF NOT EXISTS winners (
-                                date TEXT,
-                                user_id INTEGER,
-                                wallet_address TEXT,
-                                points_earned INTEGER DEFAULT 0,
-                                tokens INTEGER DEFAULT 0,
-                                status BOOLEAN DEFAULT FALSE,
-                                PRIMARY KEY (date, user_id))''')
-            await db.execute('''CREATE TABLE IF NOT EXISTS daily_points (
-                                date TEXT PRIMARY KEY,
-                                total_points_distributed INTEGER DEFAULT 0)''')
-
-            async with db.execute("PRAGMA table_info(winners)") as cursor:
-                columns = [column[1] for column in await cursor.fetchall()]
-                if 'status' not in columns:
-                    await db.execute("ALTER TABLE winners ADD COLUMN status BOOLEAN DEFAULT FALSE")
-                if 'points_earned' not in columns:
-                    await db.execute("ALTER TABLE winners ADD COLUMN points_earned INTEGER DEFAULT 0")
-                if 'tokens' not in columns:
-                    await db.execute("ALTER TABLE winners ADD COLUMN tokens INTEGER DEFAULT 0")
-
-            await db.commit()
-
-    async def get_total_points_distributed_today(self):
-        current_date = datetime.utcnow().strftime('%Y-%m-%d')
-        async with aiosqlite.connect(DB_FILE) as db:
-            async with db.execute("SELECT total_points_distributed FROM daily_points WHERE date = ?", (current_date,)) as cursor:
-                result = await cursor.fetchone()
-                return result[0] if result else 0
-
-    async def update_total_points_distributed_today(self, points):
-        current_date = datetime.utcnow().strftime('%Y-%m-%d')
-        async with aiosqlite.connect(DB_FILE) as db:
-            await db.execute("INSERT OR IGNORE INTO daily_points (date, total_points_distributed) VALUES (?, 0)", (current_date,))
-            await db.execute("UPDATE daily_points SET total_points_distributed = total_points_distributed + ? WHERE date = ?", (points, current_date))
-            await db.commit()
+
+    def cog_unload(self):
+        self.bot.cron.unregister('chat_date_rollover')
+        self.bot.cron.unregister('wallet_reminder')
+
+    def _roll_date(self):
+        """Clear the per-day filter state, runs at UTC midnight."""
+        self.budget_spent = False
+        self.cooldowns.clear()
 
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot or (message.guild and message.guild.id != GUILD_ID):
             return
 
-        user_id = message.author.id
-        current_date = datetime.utcnow().strftime('%Y-%m-%d')
-        total_points_distributed_today = await self.get_total_points_distributed_today()
+        if self.budget_spent:
+            return
 
-        if total_points_distributed_today >= TOTAL_DISTRIBUTION_LIMIT:
+        user_id = message.author.id
+        if user_id in self.capped_users:
             return
 
-        async with aiosqlite.connect(DB_FILE) as db:
-            async with db.execute("SELECT points FROM users WHERE user_id=?", (user_id,)) as cursor:
-                result = await cursor.fetchone()
+        if CHAT_COOLDOWN_SECONDS and monotonic() - self.cooldowns.get(user_id, 0) < CHAT_COOLDOWN_SECONDS:
+            return
 
-            current_points = result[0] if result else 0
+        if self.bot.budget.exhausted('chat'):
+            self.budget_spent = True
+            return
+        # exhausted() just rolled the budget over if midnight passed, both writes below use its day
+        date = self.bot.budget.date
 
-            if result is None:
-                await db.execute("INSERT INTO users (user_id, last_activity) VALUES (?, ?)", (user_id, datetime.utcnow().date()))
+        user = await self.bot.user_cache.get(user_id)
+        if user.capped(MAX_USER_POINTS):
+            self.capped_users.add(user_id)
+            return
 
-            if current_points < MAX_USER_POINTS and total_points_distributed_today + POINTS_PER_MESSAGE <= TOTAL_DISTRIBUTION_LIMIT:
-                if random.randint(1, 3) == 1:  # 1 in 3 chance
-                    self.activity_counter[user_id] += 1
-                    await db.execute("UPDATE users SET points = points + ? WHERE user_id = ?", (POINTS_PER_MESSAGE, user_id))
-                    await db.execute("INSERT OR IGNORE INTO winners (date, user_id, points_earned) VALUES (?, ?, 0)", (current_date, user_id))
-                    await db.execute("UPDATE winners SET points_earned = points_earned + ? WHERE date = ? AND user_id = ?", (POINTS_PER_MESSAGE, current_date, user_id))
-                    self.last_messages[user_id] = message
-                    await self.update_total_points_distributed_today(POINTS_PER_MESSAGE)
-                    await message.add_reaction("⛏️")
+        if random.randint(1, 3) == 1:  # 1 in 3 chance
+            if self.bot.budget.reserve('chat', POINTS_PER_MESSAGE):
+                self.activity_counter[user_id] += 1
+                self.bot.user_cache.add_points(user_id, POINTS_PER_MESSAGE)
+                await self.bot.ledger.award(user_id, date, POINTS_PER_MESSAGE)
+                if user.capped(MAX_USER_POINTS):
+                    self.capped_users.add(user_id)
+                if CHAT_COOLDOWN_SECONDS:
+                    self.cooldowns[user_id] = monotonic()
+                self.last_messages[user_id] = message
+                await message.add_reaction("⛏️")
+                return
 
-            await db.commit()
+        if not user.registered:
+            self.bot.user_cache.add_points(user_id, 0)
+            await self.bot.ledger.register(user_id, date)
 
     @app_commands.command(name="submit_wallet", description="Submit your Solana wallet address")
     async def submit_wallet(self, interaction: discord.Interaction, wallet_address: str):
         user_id = interaction.user.id
 
-        async with aiosqlite.connect(DB_FILE) as db:
-            async with db.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,)) as cursor:
-                result = await cursor.fetchone()
-
-            if not result:
-                await interaction.response.send_message("You are not registered. Please register first.", ephemeral=True)
-                return
-
-            async with db.execute("SELECT user_id FROM users WHERE wallet_address = ?", (wallet_address,)) as cursor:
-                wallet_check = await cursor.fetchone()
+        user = await self.bot.user_cache.get(user_id)
+        if not user.registered:
+            await interaction.response.send_message("You are not registered. Please register first.", ephemeral=True)
+            return
 
-            if wallet_check:
-                await interaction.response.send_message("This wallet address has already been submitted. Please use a different wallet address.", ephemeral=True)
-                return
+        wallet_check = await self.bot.db.fetchone("SELECT user_id FROM users WHERE wallet_address = ?", (wallet_address,))
+        if wallet_check:
+            await interaction.response.send_message("This wallet address has already been submitted. Please use a different wallet address.", ephemeral=True)
+            return
 
-            await db.execute("UPDATE users SET wallet_address = ? WHERE user_id = ?", (wallet_address, user_id))
-            await db.commit()
+        await self.bot.ledger.flush()  # a registration may still be waiting in the ledger
+        try:
+            await self.bot.db.execute("UPDATE users SET wallet_address = ? WHERE user_id = ?", (wallet_address, user_id))
+        except sqlite3.IntegrityError:
+            # someone else submitted the same wallet between the check and the update
+            await interaction.response.send_message("This wallet address has already been submitted. Please use a different wallet address.", ephemeral=True)
+            return
+        self.bot.user_cache.set_wallet(user_id, wallet_address)
 
-            await interaction.response.send_message("Your wallet address has been submitted.", ephemeral=True)
+        await interaction.response.send_message("Your wallet address has been submitted.", ephemeral=True)
 
 
     @tasks.loop(hours=24)
@@ -159,47 +146,73 @@ class PickWinners(commands.Cog):
         if not self.activity_counter:
             return
 
-        current_date = datetime.utcnow().strftime('%Y-%m-%d')
-
-        async with aiosqlite.connect(DB_FILE) as db:
-            for user_id in self.activity_counter.keys():
-                async with db.execute("SELECT points, wallet_address FROM users WHERE user_id=?", (user_id,)) as cursor:
-                    result = await cursor.fetchone()
-                    if result:
-                        user_points = result[0]
-                        wallet_address = result[1]
-                        if user_points >= MAX_USER_POINTS or not wallet_address:
-                            continue
-
-                        await db.execute("UPDATE users SET points = 0 WHERE user_id = ?", (user_id,))
-                        await db.execute(
-                            "INSERT INTO winners (date, user_id, points_earned, tokens, status) VALUES (?, ?, ?, ?, FALSE) "
-                            "ON CONFLICT(date, user_id) DO UPDATE SET points_earned = points_earned + ?, tokens = tokens + ?",
-                            (current_date, user_id, user_points, user_points, user_points, user_points)
-                        )
-                        await db.commit()
-                        member = self.bot.get_user(user_id)
-                        if member:
-                            try:
-                                await member.send(
-                                    "Congratulations! You've earned points today. Your wallet address is already on file."
-                                )
-                            except discord.Forbidden:
-                                guild = self.bot.get_guild(GUILD_ID)
-                                if guild:
-                                    channel = await self.create_private_channel(guild, member)
-                                    if channel:
-                                        await channel.send(
-                                            f"Hi {member.mention}, you've earned points today. Your wallet address is already on file."
-                                        )
-                                        task = self.bot.loop.create_task(
-                                            self.delete_channel_after_delay(channel, DELAY_24_HOURS_IN_SECONDS)
-                                        )
-                                        self.channel_deletion_tasks[channel.id] = task
-
+        user_ids = list(self.activity_counter)
         self.activity_counter.clear()
         self.last_messages.clear()
 
+        await self.bot.ledger.flush()
+        settled = await self.settle_users(user_ids, datetime.utcnow().strftime('%Y-%m-%d'))
+
+        for user_id in settled:
+            self.bot.user_cache.invalidate(user_id)
+            self.capped_users.discard(user_id)
+            self.bot.outbox.submit(('dm', user_id), partial(self.notify_winner, user_id), BULK)
+
+    async def settle_users(self, user_ids, current_date):
+        """Move the day's points of every eligible user into winners and reset them, in one transaction.
+
+        Users are eligible when they have a wallet on file and haven't hit MAX_USER_POINTS.
+        Returns the ids of the users that were settled.
+        """
+        async with self.bot.db.transaction() as db:
+            await db.execute("DROP TABLE IF EXISTS temp.active_users")
+            await db.execute("DROP TABLE IF EXISTS temp.settlement")
+            await db.execute("CREATE TEMP TABLE active_users (user_id INTEGER PRIMARY KEY)")
+            await db.executemany("INSERT OR IGNORE INTO active_users (user_id) VALUES (?)", [(user_id,) for user_id in user_ids])
+            await db.execute(
+                "CREATE TEMP TABLE settlement AS "
+                "SELECT users.user_id, users.points FROM users JOIN active_users USING (user_id) "
+                "WHERE users.points < ? AND users.wallet_address IS NOT NULL AND users.wallet_address != ''",
+                (MAX_USER_POINTS,)
+            )
+            await db.execute(
+                "INSERT INTO winners (date, user_id, points_earned, tokens, status) "
+                "SELECT ?, user_id, points, points, FALSE FROM settlement WHERE true "
+                "ON CONFLICT(date, user_id) DO UPDATE SET points_earned = points_earned + excluded.points_earned, tokens = tokens + excluded.tokens",
+                (current_date,)
+            )
+            await db.execute("UPDATE users SET points = 0 WHERE user_id IN (SELECT user_id FROM settlement)")
+            async with db.execute("SELECT user_id FROM settlement") as cursor:
+                settled = [row[0] for row in await cursor.fetchall()]
+            await db.execute("DROP TABLE temp.active_users")
+            await db.execute("DROP TABLE temp.settlement")
+        return settled
+
+    async def notify_winner(self, user_id):
+        member = self.bot.get_user(user_id)
+        if member:
+            try:
+                await member.send(
+                    "Congratulations! You've earned points today. Your wallet address is already on file."
+                )
+            except discord.Forbidden:
+                # DMs are closed: each step of the fallback is its own outbox job, so a
+                # retried step never repeats one that already went through
+                self.bot.outbox.submit(('guild', GUILD_ID), partial(self.open_wallet_channel, member), BULK)
+
+    async def open_wallet_channel(self, member):
+        guild = self.bot.get_guild(GUILD_ID)
+        if guild is None:
+            return
+        # a retry after a create that went through server-side finds the channel instead of making another
+        channel = discord.utils.get(guild.text_channels, name=f'wallet-{member.id}')
+        if channel is None:
+            channel = await self.create_private_channel(guild, member)
+        # in both cases, so a channel whose deletion failed to schedule last time still gets one, a second is a no-op
+        await self.delete_channel_after_delay(channel, DELAY_24_HOURS_IN_SECONDS)
+        self.bot.outbox.submit(('channel', channel.id), partial(
+            channel.send, f"Hi {member.mention}, you've earned points today. Your wallet address is already on file."
+        ), BULK)
 
     async def create_private_channel(self, guild, member):
         overwrites = {
@@ -211,38 +224,55 @@ class PickWinners(commands.Cog):
         return channel
 
     async def delete_channel_after_delay(self, channel, delay):
-        await asyncio.sleep(delay)
         if channel:
-            await channel.delete()
+            await self.bot.timers.schedule('delete_channel', {'channel_id': channel.id}, delay)
 
     async def delete_dm_after_delay(self, _member, message, delay):
-        await asyncio.sleep(delay)
+        await self.bot.timers.schedule('delete_dm', {'channel_id': message.channel.id, 'message_id': message.id}, delay)
+
+    async def delete_channels(self, payloads):
+        await self.bot.wait_until_ready()
+        return await self._run_deletions(
+            self.bot.outbox.submit(('channel', payload['channel_id']), partial(self._delete_channel, payload['channel_id']), BULK)
+            for payload in payloads
+        )
+
+    async def _delete_channel(self, channel_id):
         try:
-            await message.delete()
-        except discord.HTTPException as httperror:
-            print(f"An error occurred while deleting dm after delay {httperror}")
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+            await channel.delete()
+        except discord.NotFound:
+            pass  # already gone
+
+    async def delete_dms(self, payloads):
+        await self.bot.wait_until_ready()
+        return await self._run_deletions(
+            self.bot.outbox.submit(('dm', payload['channel_id']), partial(self._delete_dm, payload['channel_id'], payload['message_id']), BULK)
+            for payload in payloads
+        )
+
+    async def _delete_dm(self, channel_id, message_id):
+        try:
+            await self.bot.get_partial_messageable(channel_id).get_partial_message(message_id).delete()
+        except discord.NotFound:
+            pass  # already gone
+
+    async def _run_deletions(self, futures):
+        """Wait for the outbox to carry out each deletion, True for the ones that went through."""
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [not isinstance(result, BaseException) for result in results]
 
     @scoreboard_refresh.before_loop
     async def before_scoreboard_refresh(self):
         await self.bot.wait_until_ready()
 
-    @tasks.loop(hours=12)
     async def remind_wallet_submission(self):
         await self.bot.wait_until_ready()
-        current_time = datetime.utcnow().time()
-        if any(REMINDER_TIME == current_time.replace(second=0, microsecond=0) for REMINDER_TIME in REMINDER_TIMES):
-            channel = self.bot.get_channel(REMINDER_CHANNEL_ID)
-            if channel:
-                async with aiosqlite.connect(DB_FILE) as db:
-                    async with db.execute("SELECT user_id FROM users WHERE wallet_address IS NULL") as cursor:
-                        users_without_wallet = await cursor.fetchall()
-                        if users_without_wallet:
-                            await channel.send("@everyone Please submit your Solana wallet address if you haven't already using the /submit_wallet command!")
-
-
-    @remind_wallet_submission.before_loop
-    async def before_remind_wallet_submission(self):
-        await self.bot.wait_until_ready()
+        channel = self.bot.get_channel(REMINDER_CHANNEL_ID)
+        if channel:
+            result = await self.bot.db.fetchone("SELECT EXISTS (SELECT 1 FROM users WHERE wallet_address IS NULL)")
+            if result[0]:
+                await channel.send("@everyone Please submit your Solana wallet address if you haven't already using the /submit_wallet command!")
 
 async def setup(bot):
     cog = PickWinners(bot)
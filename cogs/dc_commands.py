@@ -1,29 +1,117 @@
 import os
+import re
+from time import monotonic
+from functools import partial
 from dotenv import load_dotenv
+import discord
 from discord.ext import commands
-from discord import Embed
+from discord import app_commands, Embed
 
 load_dotenv()
 
+# seconds before the same trigger can be answered again in a channel, or for a user
+TRIGGER_CHANNEL_COOLDOWN = float(os.getenv("TRIGGER_CHANNEL_COOLDOWN", "30"))
+TRIGGER_USER_COOLDOWN = float(os.getenv("TRIGGER_USER_COOLDOWN", "60"))
+MAX_COOLDOWN_ENTRIES = 10000
+
+# phrases are matched as whole words, case-insensitively, anywhere in a message;
+# {contract_address} in a title or description is filled in from the env
+TRIGGERS = [
+    {
+        "name": "contract_address",
+        "phrases": ["ca", "contract", "contract address"],
+        "title": "Contract Address",
+        "description": "```\n{contract_address}\n```",
+        "color": 0x00ff00,
+    },
+]
+
+
+def compile_triggers(triggers):
+    """One regex over every phrase, plus a map from normalised phrase to trigger name."""
+    phrases = {}
+    for trigger in triggers:
+        for phrase in trigger["phrases"]:
+            phrases[" ".join(phrase.lower().split())] = trigger["name"]
+    # longest first so "contract address" wins over "contract"
+    alternatives = "|".join(
+        r"\s+".join(re.escape(word) for word in phrase.split())
+        for phrase in sorted(phrases, key=len, reverse=True)
+    )
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE), phrases
+
+
 class DiscordCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.contract_address = os.getenv("CONTRACT_ADDRESS")
-        
+        self.pattern, self.phrases = compile_triggers(TRIGGERS)
+        self.embeds = {
+            trigger["name"]: Embed(
+                title=trigger["title"].format(contract_address=self.contract_address),
+                description=trigger["description"].format(contract_address=self.contract_address),
+                color=trigger["color"],
+            )
+            for trigger in TRIGGERS
+        }
+        self.channel_cooldowns = {}  # (trigger, channel_id) -> monotonic time it can fire again
+        self.user_cooldowns = {}  # (trigger, user_id) -> monotonic time it can fire again
+
     @commands.Cog.listener()
     async def on_ready(self):
         print(f'Bot connected as {self.bot.user}')
-       
+
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author == self.bot.user:
             return
 
-        keywords = ["ca", "contract", "contract address"]
-        message_words = message.content.lower().split()
-        if any(keyword in message_words for keyword in keywords):
-            embed = Embed(title="Contract Address", description=f"```\n{self.contract_address}\n```", color=0x00ff00)
-            await message.reply(embed=embed)
+        triggered = []
+        for match in self.pattern.finditer(message.content):
+            name = self.phrases[" ".join(match.group().lower().split())]
+            if name not in triggered:
+                triggered.append(name)
+
+        now = monotonic()
+        for name in triggered:
+            if self._cooling_down(name, message.channel.id, message.author.id, now):
+                continue
+            self.bot.outbox.submit(('channel', message.channel.id), partial(message.reply, embed=self.embeds[name]))
+
+    def _cooling_down(self, name, channel_id, user_id, now):
+        """Has the trigger fired recently here or for this user? Starts the cooldowns if not."""
+        channel_key, user_key = (name, channel_id), (name, user_id)
+        if now < self.channel_cooldowns.get(channel_key, 0) or now < self.user_cooldowns.get(user_key, 0):
+            return True
+        for cooldowns, key, seconds in ((self.channel_cooldowns, channel_key, TRIGGER_CHANNEL_COOLDOWN),
+                                        (self.user_cooldowns, user_key, TRIGGER_USER_COOLDOWN)):
+            if len(cooldowns) >= MAX_COOLDOWN_ENTRIES:
+                for expired in [key for key, until in cooldowns.items() if until <= now]:
+                    del cooldowns[expired]
+            cooldowns[key] = now + seconds
+        return False
+
+    @app_commands.command(name="bot_stats", description="Queue depths and latencies of the bot's background work.")
+    @app_commands.default_permissions(manage_guild=True)
+    async def background_stats(self, interaction: discord.Interaction):
+        outbox = self.bot.outbox.stats()
+        lines = [
+            f"**Outbox**: {outbox['queued']} queued, {outbox['pending']} pending, {outbox['sent']} sent, "
+            f"{outbox['failed']} failed, {outbox['retried']} retried",
+            f"send latency p50 {outbox['latency_p50']:.2f}s, p95 {outbox['latency_p95']:.2f}s",
+        ]
+        settlement = self.bot.settlement.stats()
+        lines += [
+            f"**Settlement**: {settlement['queued']} queued, {settlement['settled']} settled, "
+            f"{settlement['failed']} failed, {settlement['retried']} retried",
+            f"lag p50 {settlement['lag_p50']:.2f}s, p95 {settlement['lag_p95']:.2f}s",
+        ]
+        cache = self.bot.user_cache.stats()
+        lines.append(
+            f"**User cache**: {cache['size']} users, {cache['hits']} hits, {cache['misses']} misses, "
+            f"{cache['hit_rate']:.0%} hit rate"
+        )
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 async def setup(bot):
     await bot.add_cog(DiscordCommands(bot))
@@ -1,13 +1,14 @@
 import asyncio
 import os
 from typing import Union
-from itertools import groupby, chain
-from datetime import datetime
+from functools import partial
 from dotenv import load_dotenv
 import discord
 from discord import app_commands
 from discord.ext import commands
-import aiosqlite
+from utils.outbox import INTERACTIVE
+from utils.game_sessions import GameSessions
+from cogs.games.connect4_ai import choose_column
 
 def check_env_vars():
     required_vars = [
@@ -31,22 +32,39 @@ GUILD_ID = int(os.getenv("GUILD_ID"))
 MAX_USER_POINTS = int(os.getenv("CONNECT4_MAX_USER_POINTS"))
 TOTAL_DISTRIBUTION_LIMIT = int(os.getenv("CONNECT4_TOTAL_DISTRIBUTION_LIMIT"))
 POINTS_PER_WIN = int(os.getenv("CONNECT4_POINTS_PER_WIN"))
-DB_FILE = 'meme_bot.db'
 
-class Board(list):
-    __slots__ = frozenset({'width', 'height'})
+class Board:
+    """Connect 4 board stored as two bitboards, one per player.
+
+    Column x takes bits x*(height+1) to x*(height+1)+height-1, bottom row first,
+    with one spare bit on top so shifted lines can't wrap into the next column.
+    Positions use the same (x, y) coordinates as before, y=0 being the top row.
+    """
+    __slots__ = ('width', 'height', '_masks', '_heights', 'moves')
+
     def __init__(self, width, height, player1_name=None, player2_name=None):
         self.width = width
         self.height = height
-        for _ in range(width):
-            self.append([0] * height)
+        self._masks = [0, 0]  # one bitboard per player
+        self._heights = [0] * width  # pieces in each column
+        self.moves = 0
+
+    def _bit(self, x, y):
+        return 1 << (x * (self.height + 1) + self.height - 1 - y)
 
     def __getitem__(self, pos: Union[int, tuple]):
         if isinstance(pos, int):
-            return list(self)[pos]
+            return [self[pos, y] for y in range(self.height)]
         elif isinstance(pos, tuple):
             x, y = pos
-            return list(self)[x][y]
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                raise IndexError('position out of range')
+            bit = self._bit(x, y)
+            if self._masks[0] & bit:
+                return 1
+            if self._masks[1] & bit:
+                return 2
+            return 0
         else:
             raise TypeError('pos must be an int or tuple')
 
@@ -54,9 +72,16 @@ class Board(list):
         x, y = self._xy(pos)
         if self[x, y] != 0:
             raise IndexError("there's already a move at that position")
-        # basically self[x][y] = new_value
-        # super().__getitem__(x).__setitem__(y, new_value)
-        self[x][y] = new_value
+        self._masks[new_value - 1] |= self._bit(x, y)
+        self._heights[x] = max(self._heights[x], self.height - y)
+        self.moves += 1
+
+    def __iter__(self):
+        """iterate over the columns, top to bottom"""
+        return (self[x] for x in range(self.width))
+
+    def __len__(self):
+        return self.width
 
     def _xy(self, pos):
         if isinstance(pos, tuple):
@@ -69,11 +94,32 @@ class Board(list):
 
     def _y(self, x):
         """find the lowest empty row for column x"""
-        # start from the bottom and work up
-        for y in range(self.height-1, -1, -1):
-            if self[x, y] == 0:
-                return y
-        raise ValueError('that column is full')
+        if not 0 <= x < self.width:
+            raise IndexError('column out of range')
+        if self._heights[x] >= self.height:
+            raise ValueError('that column is full')
+        return self.height - 1 - self._heights[x]
+
+    def row(self, y):
+        """the pieces in row y, left to right"""
+        first, second = self._masks
+        stride = self.height + 1
+        bit = 1 << (self.height - 1 - y)
+        pieces = []
+        for _ in range(self.width):
+            pieces.append(1 if first & bit else 2 if second & bit else 0)
+            bit <<= stride
+        return pieces
+
+    def connected4(self, player):
+        """does the player have four in a row anywhere on the board?"""
+        mask = self._masks[player - 1]
+        # vertical, horizontal and both diagonals
+        for shift in (1, self.height + 1, self.height, self.height + 2):
+            pairs = mask & (mask >> shift)
+            if pairs & (pairs >> (2 * shift)):
+                return True
+        return False
 
     def _pos_diagonals(self):
         """Get positive diagonals, going from bottom-left to top-right."""
@@ -82,18 +128,15 @@ class Board(list):
 
     def _neg_diagonals(self):
         """Get negative diagonals, going from top-left to bottom-right."""
-        for di in ([(j, i - self.width + j + 1) for j in range(self.height)] for i in range(self.width + self.height - 1)):
+        for di in ([(j, i - self.width + j + 1) for j in range(self.width)] for i in range(self.width + self.height - 1)):
             yield [self[i, j] for i, j in di if i >= 0 and j >= 0 and i < self.width and j < self.height]
 
     def _full(self):
         """is there a move in every position?"""
-        for x in range(self.width):
-            if self[x, 0] == 0:
-                return False
-        return True
+        return self.moves >= self.width * self.height
 
 class Connect4Game:
-    __slots__ = frozenset({'board', 'turn_count', '_whomst_forfeited', 'names'})
+    __slots__ = frozenset({'board', 'turn_count', '_whomst_forfeited', 'names', '_winner'})
     FORFEIT = -2
     TIE = -1
     NO_WINNER = 0
@@ -111,10 +154,17 @@ class Connect4Game:
         self.board = Board(7, 6)
         self.turn_count = 0
         self._whomst_forfeited = 0
+        self._winner = self.NO_WINNER
 
     def move(self, column):
-        self.board[column] = self.whomst_turn()
+        player = self.whomst_turn()
+        self.board[column] = player
         self.turn_count += 1
+        # only the player who just moved can have completed a line
+        if self.board.connected4(player):
+            self._winner = player
+        elif self.board._full():
+            self._winner = self.TIE
 
     def forfeit(self):
         """forfeit the game as the current player"""
@@ -163,7 +213,7 @@ class Connect4Game:
         return instructions + '\n'
 
     def _format_row(self, y):
-        return ''.join(self[x, y] for x in range(self.board.width))
+        return ''.join(self.PIECES[piece] for piece in self.board.row(y))
 
     def __getitem__(self, pos):
         x, y = pos
@@ -173,22 +223,9 @@ class Connect4Game:
         """Get the winner on the current board.
         If there's no winner yet, return Connect4Game.NO_WINNER.
         If it's a tie, return Connect4Game.TIE"""
-        lines = (
-            self.board, # columns
-            zip(*self.board), # rows (zip picks the nth item from each column)
-            self.board._pos_diagonals(), # positive diagonals
-            self.board._neg_diagonals(), # negative diagonals
-        )
         if self._whomst_forfeited:
             return self.FORFEIT
-        for line in chain(*lines):
-            for player, group in groupby(line):
-                if player != 0 and len(list(group)) >= 4:
-                    return player
-        if self.board._full():
-            return self.TIE
-        else:
-            return self.NO_WINNER
+        return self._winner
 
     def other_player_name(self):
         self.turn_count += 1
@@ -206,21 +243,120 @@ class Connect4Game:
         player_number -= 1 # these lists are 0-indexed but the players aren't
         return self.names[player_number]
 
+class Connect4Button(discord.ui.Button['Connect4View']):
+    def __init__(self, column: int):
+        # discord allows five buttons per row
+        super().__init__(style=discord.ButtonStyle.secondary, label=str(column + 1), row=column // 5)
+        self.column = column
+
+    async def callback(self, interaction: discord.Interaction):
+        assert self.view is not None
+        await self.view.play(interaction, self.column)
+
+class Connect4ForfeitButton(discord.ui.Button['Connect4View']):
+    def __init__(self):
+        super().__init__(style=discord.ButtonStyle.danger, emoji='🚫', row=1)
+
+    async def callback(self, interaction: discord.Interaction):
+        assert self.view is not None
+        await self.view.forfeit(interaction)
+
+class Connect4View(discord.ui.View):
+    """One game, every move is answered with an edit of the game message.
+
+    Against the bot the player's move is shown straight away with the buttons
+    disabled, and a second edit adds the bot's reply once it's been worked out.
+
+    Idle games are expired by the cog's session registry rather than a view
+    timeout, so there's no timeout task per game.
+    """
+
+    def __init__(self, cog, game: Connect4Game, players, vs_bot=False):
+        super().__init__(timeout=None)
+        self.cog = cog
+        self.game = game
+        self.players = players
+        self.vs_bot = vs_bot
+        self.message = None
+        for column in range(game.board.width):
+            self.add_item(Connect4Button(column))
+        self.add_item(Connect4ForfeitButton())
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.players[self.game.whomst_turn() - 1].id:
+            await interaction.response.send_message("It's not your turn!", ephemeral=True)
+            return False
+        self.cog.sessions.touch(interaction.message.id)
+        return True
+
+    async def play(self, interaction: discord.Interaction, column: int):
+        try:
+            self.game.move(column)
+        except ValueError:
+            await interaction.response.send_message("That column is full!", ephemeral=True)
+            return
+        if self.vs_bot and self.game.whomst_won() == self.game.NO_WINNER:
+            # answer with the player's disc first, the search can take longer than Discord waits for a response
+            self._refresh_buttons(True)
+            await interaction.response.edit_message(content=str(self.game), view=self)
+            self.game.move(await self.cog.bot_move(self.game))
+            await self.update(interaction, responded=True)
+            return
+        await self.update(interaction)
+
+    async def forfeit(self, interaction: discord.Interaction):
+        self.game.forfeit()
+        await self.update(interaction)
+
+    async def update(self, interaction: discord.Interaction, responded=False):
+        finished = self.game.whomst_won() != self.game.NO_WINNER
+        self._refresh_buttons(finished)
+        if responded:
+            await interaction.edit_original_response(content=str(self.game), view=self)
+        else:
+            await interaction.response.edit_message(content=str(self.game), view=self)
+        if finished:
+            self.stop()
+            self.cog.sessions.remove(interaction.message.id)
+            self.cog.end_game(self.game, interaction, self.players, self.vs_bot)
+
+    def _refresh_buttons(self, finished):
+        for child in self.children:
+            if isinstance(child, Connect4Button):
+                child.disabled = finished or self.game.board._heights[child.column] >= self.game.board.height
+            else:
+                child.disabled = finished
+
+    async def expire(self):
+        self.stop()
+        self.game.forfeit()
+        self._refresh_buttons(True)
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(content=str(self.game), view=self)
+            await self.message.reply("> Game was ended due to running out of time!")
+        except discord.HTTPException:
+            pass
+
 class Connect4(commands.Cog):
-    CANCEL_GAME_EMOJI = '🚫'
-    DIGITS = [str(digit) + '\N{combining enclosing keycap}' for digit in range(1, 8)] + ['🚫']
-    VALID_REACTIONS = [CANCEL_GAME_EMOJI] + DIGITS
     GAME_TIMEOUT_THRESHOLD = 600
 
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
+        self.bot.budget.set_limit('connect4', TOTAL_DISTRIBUTION_LIMIT)
+        self.sessions = GameSessions(self.GAME_TIMEOUT_THRESHOLD)
+        self.sessions.start()
+
+    async def cog_unload(self):
+        await self.sessions.close()
 
     @commands.Cog.listener()
     async def on_ready(self):
         print("Connect 4 is online.")
 
     @app_commands.command(name="connect4", description="Play Connect 4.")
-    @app_commands.describe(player2="Player to challenge.")
+    @app_commands.describe(player2="Player to challenge, or the bot for a practice game.")
     @app_commands.checks.cooldown(1, 5, key=lambda i: (i.user.id))
     async def connect4(self, interaction: discord.Interaction, player2: discord.Member):
         if interaction.guild.id != GUILD_ID:
@@ -228,86 +364,36 @@ class Connect4(commands.Cog):
             return
 
         player1 = interaction.user
+        vs_bot = player2.id == self.bot.user.id
         game = Connect4Game(player1.mention, player2.mention)
-        await interaction.response.send_message("Game Started!", ephemeral=True)
-        message = await interaction.channel.send(str(game))
-        for digit in self.DIGITS:
-            await message.add_reaction(digit)
-
-        def check(reaction, user):
-            return (
-                user == (player1, player2)[game.whomst_turn() - 1]
-                and str(reaction) in self.VALID_REACTIONS
-                and reaction.message.id == message.id
-            )
+        view = Connect4View(self, game, (player1, player2), vs_bot)
+        await interaction.response.send_message(str(game), view=view)
+        view.message = await interaction.original_response()
+        self.sessions.add(view.message.id, view)
 
-        while game.whomst_won() == game.NO_WINNER:
-            try:
-                reaction, user = await self.bot.wait_for(
-                    'reaction_add',
-                    check=check,
-                    timeout=self.GAME_TIMEOUT_THRESHOLD
-                )
-            except asyncio.TimeoutError:
-                game.forfeit()
-                await message.reply("> Game was ended due to running out of time!")
-                break
-
-            await asyncio.sleep(0.2)
-            try:
-                await message.remove_reaction(reaction, user)
-            except discord.errors.Forbidden:
-                pass
-
-            if str(reaction) == self.CANCEL_GAME_EMOJI:
-                game.forfeit()
-                break
-
-            try:
-                game.move(self.DIGITS.index(str(reaction)))
-            except ValueError:
-                pass
-            await message.edit(content=str(game))
-
-        await self.end_game(game, message, interaction)
-
-    async def end_game(self, game, message, interaction):
-        await message.edit(content=str(game))
-        await self.clear_reactions(message)
+    @staticmethod
+    async def bot_move(game):
+        """Search for the bot's column in a worker thread so the event loop keeps running."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, choose_column, game.board, game.whomst_turn())
+
+    def end_game(self, game, interaction, players, vs_bot=False):
         winner = game.whomst_won()
-        if winner > 0:
-            winner_id = (interaction.user.id if winner == 1 else interaction.data['options'][0]['value'])
-            await self.update_winner_points(winner_id, interaction)
-
-    async def update_winner_points(self, winner_id, interaction):
-        current_date = datetime.utcnow().strftime('%Y-%m-%d')
-
-        async with aiosqlite.connect(DB_FILE) as db:
-            async with db.execute("SELECT points FROM users WHERE user_id=?", (winner_id,)) as cursor:
-                result = await cursor.fetchone()
-                current_points = result[0] if result else 0
-
-            async with db.execute("SELECT total_points_distributed FROM daily_points WHERE date=?", (current_date,)) as cursor:
-                daily_points = await cursor.fetchone()
-                total_points_distributed_today = daily_points[0] if daily_points else 0
-
-            if current_points < MAX_USER_POINTS and total_points_distributed_today + POINTS_PER_WIN <= TOTAL_DISTRIBUTION_LIMIT:
-                new_points = min(MAX_USER_POINTS - current_points, POINTS_PER_WIN)
-                await db.execute("UPDATE users SET points = points + ? WHERE user_id = ?", (new_points, winner_id))
-                await db.execute("INSERT OR IGNORE INTO winners (date, user_id, points_earned, tokens, status) VALUES (?, ?, ?, ?, FALSE) ON CONFLICT(date, user_id) DO UPDATE SET points_earned = points_earned + ?, tokens = tokens + ?", (current_date, winner_id, new_points, new_points, new_points, new_points))
-                await db.execute("INSERT OR IGNORE INTO daily_points (date, total_points_distributed) VALUES (?, 0)", (current_date,))
-                await db.execute("UPDATE daily_points SET total_points_distributed = total_points_distributed + ? WHERE date = ?", (new_points, current_date))
-                await db.commit()
-                await interaction.followup.send(f"Congratulations! You've been awarded {new_points} points.", ephemeral=True)
-            else:
-                await interaction.followup.send("The daily points limit has been reached or you've reached the maximum points.", ephemeral=True)
+        # games against the bot are for practice, they don't earn points
+        if winner > 0 and not vs_bot:
+            self.bot.settlement.submit(
+                'connect4', players[winner - 1].id, POINTS_PER_WIN, MAX_USER_POINTS, partial(self.notify_winner, interaction)
+            )
 
-    @staticmethod
-    async def clear_reactions(message):
-        try:
-            await message.clear_reactions()
-        except discord.HTTPException:
-            pass
+    async def notify_winner(self, interaction, points, user):
+        if points:
+            content = f"Congratulations! You've been awarded {points} points."
+        elif user is None:
+            content = "Your win couldn't be recorded right now, sorry."
+        else:
+            content = "The daily points limit has been reached or you've reached the maximum points."
+        # followups go through the interaction's webhook, not the channel, so they get their own route
+        self.bot.outbox.submit(('interaction', interaction.id), partial(interaction.followup.send, content, ephemeral=True), INTERACTIVE)
 
     @app_commands.command(name="connect4_guide", description="Learn how to play Connect 4.")
     async def connect4_guide(self, interaction: discord.Interaction):
@@ -317,8 +403,8 @@ class Connect4(commands.Cog):
             "seven-column, six-row vertically suspended grid. The pieces fall straight down, occupying the lowest available space within the column. "
             "The objective of the game is to be the first to form a horizontal, vertical, or diagonal line of four of one's own discs.\n\n"
             "Here's how to play with this bot:\n"
-            "1. Start a game by using the `/connect4` command and tagging another player.\n"
-            "2. React to the game board message with a number (1-7) to drop your piece in that column.\n"
+            "1. Start a game by using the `/connect4` command and tagging another player, or tag the bot to practice against it (practice games don't earn points).\n"
+            "2. Press a numbered button (1-7) under the game board to drop your piece in that column, or 🚫 to forfeit.\n"
             "3. The game will continue until one player forms a line of four pieces or the board is full.\n"
             "4. If the game is not completed in time, it will end automatically.\n\n"
             "For a video guide, watch this : [How to Play Connect 4](https://www.youtube.com/watch?v=LK9PCdPwV-k)\n\n"
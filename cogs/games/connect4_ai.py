@@ -0,0 +1,195 @@
+"""Connect 4 bot opponent.
+
+Iterative-deepening negamax with alpha-beta pruning over the bitboards of
+``connect4.Board``: a transposition table, threat-based move ordering and a wall
+clock budget per move. Positions are passed around as two ints, the stones of
+the player to move and the mask of all stones, so the search never touches the
+Board object itself and can run in an executor thread.
+"""
+import time
+
+DEFAULT_THINK_TIME = 0.05  # seconds per move
+WIN_SCORE = 1000
+TT_MAX_ENTRIES = 500_000
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def _popcount(x):
+    return bin(x).count('1')
+
+
+class _Geometry:
+    """Bit masks for a board size, see Board for the layout."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.stride = height + 1
+        self.cells = width * height
+        self.bottom = sum(1 << (x * self.stride) for x in range(width))
+        self.board = self.bottom * ((1 << height) - 1)
+        self.columns = [((1 << height) - 1) << (x * self.stride) for x in range(width)]
+        # try the middle columns first, they take part in the most lines
+        self.order = sorted(range(width), key=lambda x: abs(width // 2 - x))
+
+    def winning_spots(self, position, mask):
+        """Empty cells that would give ``position`` four in a row."""
+        h = self.height
+        # vertical
+        spots = (position << 1) & (position << 2) & (position << 3)
+        # horizontal and both diagonals
+        for shift in (h + 1, h, h + 2):
+            pair = (position << shift) & (position << 2 * shift)
+            spots |= pair & (position << 3 * shift)
+            spots |= pair & (position >> shift)
+            pair = (position >> shift) & (position >> 2 * shift)
+            spots |= pair & (position << shift)
+            spots |= pair & (position >> 3 * shift)
+        return spots & (self.board ^ mask)
+
+    def column_of(self, bit):
+        return (bit.bit_length() - 1) // self.stride
+
+
+_geometries = {}
+
+
+def _geometry(width, height):
+    geometry = _geometries.get((width, height))
+    if geometry is None:
+        geometry = _geometries[(width, height)] = _Geometry(width, height)
+    return geometry
+
+
+class _Search:
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, geometry, deadline):
+        self.g = geometry
+        self.deadline = deadline
+        self.table = {}  # position + mask -> (depth, flag, score, move)
+        self.nodes = 0
+
+    def moves(self, position, mask, moves):
+        """Playable move bits that don't hand the opponent a win, best first.
+
+        Returns (None, score) when the position is already decided.
+        """
+        g = self.g
+        possible = (mask + g.bottom) & g.board
+        if g.winning_spots(position, mask) & possible:
+            return None, WIN_SCORE - moves
+        if not possible:
+            return None, 0
+        threats = g.winning_spots(position ^ mask, mask)
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1):
+                return None, -(WIN_SCORE - moves - 1)  # two threats, can't block both
+            possible = forced
+        # never play right below a cell the opponent wins with
+        possible &= ~(threats >> 1)
+        if not possible:
+            return None, -(WIN_SCORE - moves - 1)
+
+        candidates = []
+        for x in g.order:
+            bit = possible & g.columns[x]
+            if bit:
+                candidates.append((_popcount(g.winning_spots(position | bit, mask)), bit))
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return [bit for _, bit in candidates], None
+
+    def evaluate(self, position, mask):
+        g = self.g
+        return _popcount(g.winning_spots(position, mask)) - _popcount(g.winning_spots(position ^ mask, mask))
+
+    def negamax(self, position, mask, moves, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & 127 and time.perf_counter() > self.deadline:
+            raise _OutOfTime
+
+        ordered, score = self.moves(position, mask, moves)
+        if ordered is None:
+            return score, None
+        if depth == 0:
+            return self.evaluate(position, mask), None
+
+        key = position + mask
+        entry = self.table.get(key)
+        best_move = None
+        if entry is not None:
+            entry_depth, flag, entry_score, best_move = entry
+            if entry_depth >= depth:
+                if flag == self.EXACT:
+                    return entry_score, best_move
+                if flag == self.LOWER:
+                    alpha = max(alpha, entry_score)
+                elif flag == self.UPPER:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score, best_move
+            if best_move in ordered:
+                ordered.remove(best_move)
+                ordered.insert(0, best_move)
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        for bit in ordered:
+            score = -self.negamax(position ^ mask, mask | bit, moves + 1, depth - 1, -beta, -alpha)[0]
+            if score > best_score:
+                best_score, best_move = score, bit
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = self.UPPER
+        elif best_score >= beta:
+            flag = self.LOWER
+        else:
+            flag = self.EXACT
+        if len(self.table) > TT_MAX_ENTRIES:
+            self.table.clear()
+        self.table[key] = (depth, flag, best_score, best_move)
+        return best_score, best_move
+
+
+def choose_column(board, player, think_time=DEFAULT_THINK_TIME):
+    """Pick a column for ``player`` on ``board`` within ``think_time`` seconds.
+
+    Safe to call from an executor, only reads plain ints off the board.
+    """
+    geometry = _geometry(board.width, board.height)
+    first, second = board._masks
+    mask = first | second
+    position = first if player == 1 else second
+    moves = board.moves
+
+    search = _Search(geometry, time.perf_counter() + think_time)
+    ordered, _ = search.moves(position, mask, moves)
+    possible = (mask + geometry.bottom) & geometry.board
+    if ordered is None:
+        # won already, lost anyway or nothing left to play: take any winning or legal move
+        winning = geometry.winning_spots(position, mask) & possible
+        bit = winning & -winning or possible & -possible
+        if not bit:
+            raise ValueError('the board is full')
+        return geometry.column_of(bit)
+    if len(ordered) == 1:
+        return geometry.column_of(ordered[0])
+
+    best = ordered[0]
+    try:
+        for depth in range(1, geometry.cells - moves + 1):
+            score, move = search.negamax(position, mask, moves, depth, -WIN_SCORE - 1, WIN_SCORE + 1)
+            if move is not None:
+                best = move
+            if abs(score) >= WIN_SCORE - geometry.cells:
+                break  # the game is decided, searching deeper won't change the move
+    except _OutOfTime:
+        pass
+    return geometry.column_of(best)
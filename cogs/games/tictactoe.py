@@ -1,19 +1,25 @@
+import random
 from typing import List
+from functools import partial
+from collections import Counter
 from discord.ext import commands
 import discord
 from discord import app_commands
-import aiosqlite
-from datetime import datetime
 import os
+from utils.game_sessions import GameSessions
+from cogs.games.tictactoe_table import POW3, MARKS, WINNERS, BEST_MOVES
 
 GUILD_ID = int(os.getenv("GUILD_ID"))
 TTT_MAX_USER_POINTS = int(os.getenv("TTT_MAX_USER_POINTS"))
 TTT_TOTAL_DISTRIBUTION_LIMIT = int(os.getenv("TTT_TOTAL_DISTRIBUTION_LIMIT"))
 TTT_POINTS_PER_WIN = int(os.getenv("TTT_POINTS_PER_WIN"))
-DB_FILE = "meme_bot.db"
-
-player1 = None
-player2 = None
+# seconds without a move before a game is ended
+TTT_GAME_TIMEOUT = float(os.getenv("TTT_GAME_TIMEOUT", "600"))
+# games running at once across the bot, and per player
+TTT_MAX_GAMES = int(os.getenv("TTT_MAX_GAMES", "5000"))
+TTT_MAX_GAMES_PER_USER = int(os.getenv("TTT_MAX_GAMES_PER_USER", "3"))
+# chance the bot plays a random cell instead of the best one, 0 = perfect play
+TTT_BOT_HANDICAP = float(os.getenv("TTT_BOT_HANDICAP", "0.25"))
 
 class TicTacToeButton(discord.ui.Button['TicTacToe']):
     def __init__(self, x: int, y: int):
@@ -22,46 +28,40 @@ class TicTacToeButton(discord.ui.Button['TicTacToe']):
         self.y = y
 
     async def callback(self, interaction: discord.Interaction):
-        global player1, player2
         assert self.view is not None
         view: TicTacToe = self.view
+        player1, player2 = view.player1, view.player2
         state = view.board[self.y][self.x]
         if state in (view.X, view.O):
             return
+        player = player1 if view.current_player == view.X else player2
+        if interaction.user.id != player.id:
+            await interaction.response.send_message("It's not your Turn!", ephemeral=True)
+            return
+        view.place(self)
+        if view.vs_bot and view.check_board_winner() is None:
+            view.place(view.bot_move())
         if view.current_player == view.X:
-            if interaction.user != player1:
-                await interaction.response.send_message("It's not your Turn!", ephemeral=True)
-            else:
-                self.style = discord.ButtonStyle.danger
-                self.label = 'X'
-                self.disabled = True
-                view.board[self.y][self.x] = view.X
-                view.current_player = view.O
-                content = f"It is now {player2.mention}'s turn **O**"
+            content = f"It is now {player1.mention}'s turn **X**"
         else:
-            if interaction.user != player2:
-                await interaction.response.send_message("It's not your Turn!", ephemeral=True)
-            else:
-                self.style = discord.ButtonStyle.success
-                self.label = 'O'
-                self.disabled = True
-                view.board[self.y][self.x] = view.O
-                view.current_player = view.X
-                content = f"It is now {player1.mention}'s turn **X**"
-        
+            content = f"It is now {player2.mention}'s turn **O**"
+        view.sessions.touch(interaction.message.id)
+
         winner = view.check_board_winner()
         if winner is not None:
+            # stop taking clicks before awaiting anything, the board is decided
+            view.finish()
+            # games against the bot are for practice, they don't earn points
             if winner == view.X:
                 content = f'{player1.mention} **X** won!'
-                await self.view.handle_winner(player1.id)
+                if not view.vs_bot:
+                    view.handle_winner(player1.id)
             elif winner == view.O:
                 content = f'{player2.mention} **O** won!'
-                await self.view.handle_winner(player2.id)
+                if not view.vs_bot:
+                    view.handle_winner(player2.id)
             else:
                 content = "It's a tie!"
-            for child in view.children:
-                child.disabled = True
-            view.stop()
         await interaction.response.edit_message(content=content, view=view)
 
 class TicTacToe(discord.ui.View):
@@ -70,96 +70,134 @@ class TicTacToe(discord.ui.View):
     O = 1
     Tie = 2
 
-    def __init__(self, client: commands.Bot):
-        super().__init__()
-        self.client = client
+    def __init__(self, cog, player1: discord.Member, player2: discord.Member, vs_bot=False):
+        # idle games are expired by the cog's session registry, not a timeout per view
+        super().__init__(timeout=None)
+        self.cog = cog
+        self.client = cog.client
+        self.sessions = cog.sessions
+        self.player1 = player1
+        self.player2 = player2
+        self.vs_bot = vs_bot
+        self.message = None
         self.current_player = self.X
         self.board = [
             [0, 0, 0],
             [0, 0, 0],
             [0, 0, 0],
         ]
+        self.state = 0  # the board encoded for the lookup tables
 
         for x in range(3):
             for y in range(3):
                 self.add_item(TicTacToeButton(x, y))
 
     def check_board_winner(self):
-        for across in self.board:
-            value = sum(across)
-            if value == 3:
-                return self.O
-            elif value == -3:
-                return self.X
-
-        for line in range(3):
-            value = self.board[0][line] + self.board[1][line] + self.board[2][line]
-            if value == 3:
-                return self.O
-            elif value == -3:
-                return self.X
-
-        diag = self.board[0][2] + self.board[1][1] + self.board[2][0]
-        if diag == 3:
-            return self.O
-        elif diag == -3:
-            return self.X
-        diag = self.board[0][0] + self.board[1][1] + self.board[2][2]
-        if diag == 3:
-            return self.O
-        elif diag == -3:
-            return self.X
-        
-        if all(i != 0 for row in self.board for i in row):
-            return self.Tie
-        return None
-
-
-    async def handle_winner(self, winner_id: int):
-        current_date = datetime.utcnow().strftime('%Y-%m-%d')
-        
-        async with aiosqlite.connect(DB_FILE) as db:
-            async with db.execute("SELECT points, wallet_address FROM users WHERE user_id=?", (winner_id,)) as cursor:
-                result = await cursor.fetchone()
-                current_points = result[0] if result else 0
-                has_wallet_address = bool(result[1]) if result else False
-
-            async with db.execute("SELECT total_points_distributed FROM daily_points WHERE date=?", (current_date,)) as cursor:
-                daily_points = await cursor.fetchone()
-                total_points_distributed_today = daily_points[0] if daily_points else 0
-
-            if current_points < TTT_MAX_USER_POINTS and total_points_distributed_today + TTT_POINTS_PER_WIN <= TTT_TOTAL_DISTRIBUTION_LIMIT:
-                new_points = min(TTT_MAX_USER_POINTS - current_points, TTT_POINTS_PER_WIN)
-                await db.execute("INSERT OR IGNORE INTO users (user_id, points) VALUES (?, ?)", (winner_id, 0))
-                await db.execute("UPDATE users SET points = points + ? WHERE user_id = ?", (new_points, winner_id))
-                await db.execute("INSERT OR IGNORE INTO winners (date, user_id, points_earned, tokens, status) VALUES (?, ?, ?, ?, FALSE) ON CONFLICT(date, user_id) DO UPDATE SET points_earned = points_earned + ?, tokens = tokens + ?", (current_date, winner_id, new_points, new_points, new_points, new_points))
-                await db.execute("INSERT OR IGNORE INTO daily_points (date, total_points_distributed) VALUES (?, 0)", (current_date,))
-                await db.execute("UPDATE daily_points SET total_points_distributed = total_points_distributed + ? WHERE date = ?", (new_points, current_date))
-                await db.commit()
-
-                if not has_wallet_address:
-                    user = self.client.get_user(winner_id)
-                    if user:
-                        await user.send("Congratulations on winning! Please submit your wallet address to claim your points.")
+        return WINNERS[self.state]
+
+    def place(self, button: TicTacToeButton):
+        """Mark the button's cell for the current player and pass the turn."""
+        if self.current_player == self.X:
+            button.style = discord.ButtonStyle.danger
+            button.label = 'X'
+        else:
+            button.style = discord.ButtonStyle.success
+            button.label = 'O'
+        button.disabled = True
+        self.board[button.y][button.x] = self.current_player
+        self.state += MARKS[self.current_player] * POW3[button.y * 3 + button.x]
+        self.current_player = -self.current_player
+
+    def bot_move(self) -> TicTacToeButton:
+        """The button the bot presses, the best cell unless the handicap kicks in."""
+        if random.random() < TTT_BOT_HANDICAP:
+            cell = random.choice([cell for cell in range(9) if not self.board[cell // 3][cell % 3]])
+        else:
+            cell = BEST_MOVES[self.state]
+        return self.children[cell % 3 * 3 + cell // 3]  # buttons were added column by column
+
+    def finish(self):
+        """Stop taking moves and free the game's slots, safe to call more than once."""
+        if self.is_finished():
+            return
+        for child in self.children:
+            child.disabled = True
+        self.stop()
+        if self.message is not None:
+            self.sessions.remove(self.message.id)
+        self.cog.game_over(self)
+
+    async def expire(self):
+        self.finish()
+        try:
+            await self.message.edit(content="Game ended, nobody moved in time!", view=self)
+        except discord.HTTPException:
+            pass
+
+
+    def handle_winner(self, winner_id: int):
+        self.client.settlement.submit('tictactoe', winner_id, TTT_POINTS_PER_WIN, TTT_MAX_USER_POINTS, partial(self.notify_winner, winner_id))
+
+    async def notify_winner(self, winner_id, points, user_state):
+        if points and not user_state.wallet_address:
+            user = self.client.get_user(winner_id)
+            if user:
+                self.client.outbox.submit(('dm', winner_id), partial(user.send, "Congratulations on winning! Please submit your wallet address to claim your points."))
 
 
 class TictactoeCog(commands.Cog):
     def __init__(self, client):
         self.client = client
+        self.client.budget.set_limit('tictactoe', TTT_TOTAL_DISTRIBUTION_LIMIT)
+        self.sessions = GameSessions(TTT_GAME_TIMEOUT)
+        self.sessions.start()
+        self.running = 0
+        self.games_per_user = Counter()
+
+    async def cog_unload(self):
+        await self.sessions.close()
+
+    @staticmethod
+    def _players(view):
+        # the bot can be in any number of games
+        return (view.player1,) if view.vs_bot else (view.player1, view.player2)
+
+    def game_over(self, view):
+        self.running -= 1
+        for player in self._players(view):
+            self.games_per_user[player.id] -= 1
+            if self.games_per_user[player.id] <= 0:
+                del self.games_per_user[player.id]
 
     @commands.Cog.listener()
     async def on_ready(self):
         print("TicTacToe is online.")
 
     @app_commands.command(name="tictactoe", description="Play TicTacToe.")
-    @app_commands.describe(enemy="Player to challenge.")
+    @app_commands.describe(enemy="Player to challenge, or the bot for a practice game.")
     @app_commands.checks.cooldown(1, 5, key=lambda i: (i.user.id))
     async def tictactoe(self, interaction: discord.Interaction, enemy: discord.Member):
-        global player1, player2
-        player1 = interaction.user
-        player2 = enemy
-        await interaction.response.send_message(f"Tic Tac Toe: {interaction.user.mention} goes first **X**", view=TicTacToe(self.client))
-        
+        view = TicTacToe(self, interaction.user, enemy, enemy.id == self.client.user.id)
+        if self.running >= TTT_MAX_GAMES:
+            await interaction.response.send_message("Too many games are running right now, try again in a bit.", ephemeral=True)
+            return
+        if any(self.games_per_user[player.id] >= TTT_MAX_GAMES_PER_USER for player in self._players(view)):
+            await interaction.response.send_message(f"Players can only be in {TTT_MAX_GAMES_PER_USER} games at once, finish one first.", ephemeral=True)
+            return
+
+        # take the slots before awaiting so concurrent commands can't go over the caps
+        self.running += 1
+        for player in self._players(view):
+            self.games_per_user[player.id] += 1
+        try:
+            await interaction.response.send_message(f"Tic Tac Toe: {interaction.user.mention} goes first **X**", view=view)
+            view.message = await interaction.original_response()
+        except Exception:
+            view.finish()
+            raise
+        if not view.is_finished():
+            self.sessions.add(view.message.id, view)
+
     @app_commands.command(name="ttt_guide", description="Learn how to play TicTacToe.")
     async def ttt_guide(self, interaction: discord.Interaction):
         guide_message = (
@@ -167,9 +205,10 @@ class TictactoeCog(commands.Cog):
             "TicTacToe is a simple two-player game where each player takes turns marking a square in a 3x3 grid with their symbol (X or O). "
             "The goal is to be the first player to get three of their symbols in a row, column, or diagonal.\n\n"
             "Here's how to play with this bot:\n"
-            "1. Start a game by using the `/tictactoe` command and mentioning another player.\n"
+            "1. Start a game by using the `/tictactoe` command and mentioning another player, or mention the bot to practice against it (practice games don't earn points).\n"
             "2. The game board will appear, and you can mark your move by selecting a number corresponding to the position on the grid.\n"
-            "3. The game will continue until one player wins or the board is full.\n\n"
+            "3. The game will continue until one player wins or the board is full.\n"
+            "4. If nobody moves for a while, the game ends automatically.\n\n"
             "For a visual guide, watch this video: [How to Play TicTacToe](https://www.youtube.com/watch?v=3qzcAMShotQ)\n\n"
             "Enjoy the game and good luck!"
         )
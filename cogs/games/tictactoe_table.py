@@ -0,0 +1,69 @@
+"""Precomputed TicTacToe positions.
+
+Every board is encoded as a base-3 number, cell ``y * 3 + x`` holding 0 for
+empty, 1 for X and 2 for O, so a move is a single addition of
+``MARK * POW3[cell]``. WINNERS and BEST_MOVES are built once at import over all
+3^9 codes, turning the win check and the bot's move into list lookups.
+"""
+
+X = -1
+O = 1
+TIE = 2
+
+POW3 = [3 ** cell for cell in range(9)]
+MARKS = {X: 1, O: 2}
+LINES = ((0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6))
+
+
+def encode(board):
+    """Code for a ``board[y][x]`` grid of X, O and 0."""
+    return sum(MARKS.get(board[cell // 3][cell % 3], 0) * POW3[cell] for cell in range(9))
+
+
+def _decode(code):
+    cells = []
+    for _ in range(9):
+        code, cell = divmod(code, 3)
+        cells.append(cell)
+    return cells
+
+
+def _winner(cells):
+    for a, b, c in LINES:
+        if cells[a] and cells[a] == cells[b] == cells[c]:
+            return X if cells[a] == 1 else O
+    return TIE if all(cells) else None
+
+
+def _build():
+    winners = [_winner(_decode(code)) for code in range(3 ** 9)]
+    best_moves = [-1] * 3 ** 9
+    scores = {}
+
+    def solve(code, cells):
+        """Score for the player to move, quicker wins score higher."""
+        if code in scores:
+            return scores[code]
+        empty = [cell for cell in range(9) if not cells[cell]]
+        if winners[code] is not None:
+            # the player who just moved won, or it's a tie
+            score = 0 if winners[code] == TIE else -(len(empty) + 1)
+        else:
+            mark = 1 if len(empty) % 2 else 2  # X moves first, so X has an odd count of empty cells
+            score = None
+            for cell in empty:
+                cells[cell] = mark
+                child = -solve(code + mark * POW3[cell], cells)
+                cells[cell] = 0
+                if score is None or child > score:
+                    score, best_moves[code] = child, cell
+        scores[code] = score
+        return score
+
+    solve(0, [0] * 9)
+    return winners, best_moves
+
+
+# WINNERS[code] is X, O, TIE or None, BEST_MOVES[code] the cell perfect play
+# takes for whoever moves next (-1 for finished or unreachable boards)
+WINNERS, BEST_MOVES = _build()
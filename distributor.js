@@ -39,7 +39,7 @@ async function sentTx() {
   db.serialize(() => {
     // Querying the DB
     db.all(
-      "SELECT wallet_address, tokens, status FROM winners",
+      "SELECT wallet_address, tokens, status FROM winners WHERE status = 0 AND wallet_address IS NOT NULL AND tokens > 0",
       [],
       async (err, rows) => {
         if (!err) {
@@ -122,7 +122,7 @@ async function sentTx() {
 
               //update the DB
               const updateDB = `UPDATE winners SET status = 1
-                                WHERE  wallet_address= ?;`;
+                                WHERE  wallet_address= ? AND status = 0;`;
 
               // change DB state
               if (signAndSendTx) {
@@ -3,6 +3,14 @@ import os
 from dotenv import load_dotenv
 import asyncio
 from discord import Intents
+from utils.database import Database, DB_FILE
+from utils.points_ledger import PointsLedger
+from utils.budget import DailyBudget
+from utils.user_cache import UserCache
+from utils.outbox import Outbox
+from utils.timers import TimerScheduler
+from utils.cron import Cron
+from utils.settlement import Settlement
 
 def check_env_vars():
     required_vars = [
@@ -50,10 +58,34 @@ async def load_cogs():
             print(f'Failed to load {cog}: AttributeError occurred.')
 
 async def main():
-    async with bot:
-        await load_cogs()
-        token = os.getenv("DISCORD_BOT")
-        await bot.start(token)
+    bot.db = Database(DB_FILE)
+    await bot.db.connect()
+    await bot.db.init_db()
+    bot.budget = DailyBudget(bot.db)
+    await bot.budget.load()
+    bot.ledger = PointsLedger(bot.db)
+    bot.ledger.start()
+    bot.user_cache = UserCache(bot.db, bot.ledger)
+    bot.outbox = Outbox()
+    bot.outbox.start()
+    bot.settlement = Settlement(bot.db, bot.budget, bot.user_cache)
+    bot.settlement.start()
+    bot.timers = TimerScheduler(bot.db)
+    bot.cron = Cron()
+    bot.cron.start()
+    try:
+        async with bot:
+            await load_cogs()
+            await bot.timers.start()
+            token = os.getenv("DISCORD_BOT")
+            await bot.start(token)
+    finally:
+        await bot.cron.close()
+        await bot.timers.close()
+        await bot.settlement.close()
+        await bot.outbox.close()
+        await bot.ledger.close()
+        await bot.db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,78 @@
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# points that can be handed out per day across chat and all games (optional, no cap when unset)
+GLOBAL_DAILY_DISTRIBUTION_LIMIT = int(os.getenv("GLOBAL_DAILY_DISTRIBUTION_LIMIT")) if os.getenv("GLOBAL_DAILY_DISTRIBUTION_LIMIT") else None
+
+
+class DailyBudget:
+    """In-memory daily distribution budget shared by chat and the games.
+
+    Every source (``chat``, ``connect4``, ``tictactoe``) registers its own daily
+    limit and there can be one global limit on top. ``reserve`` takes points from both
+    at once without touching the db, so two concurrent awards can never push a
+    source or the day over its limit. The counters are loaded from the db at
+    startup and reset at UTC midnight.
+    """
+
+    def __init__(self, db, total_limit=GLOBAL_DAILY_DISTRIBUTION_LIMIT):
+        self.db = db
+        self.total_limit = total_limit
+        self.limits = {}
+        self.date = None
+        self.total = 0
+        self.used = Counter()
+        self._reset_at = 0
+
+    def set_limit(self, source, limit):
+        self.limits[source] = limit
+
+    async def load(self):
+        self._roll_over()
+        result = await self.db.fetchone("SELECT total_points_distributed FROM daily_points WHERE date = ?", (self.date,))
+        self.total = result[0] if result else 0
+        rows = await self.db.fetchall("SELECT source, points FROM daily_source_points WHERE date = ?", (self.date,))
+        self.used = Counter(dict(rows))
+
+    def _roll_over(self):
+        now = datetime.utcnow()
+        self.date = now.strftime('%Y-%m-%d')
+        self.total = 0
+        self.used = Counter()
+        midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+        self._reset_at = time.time() + (midnight - now).total_seconds()
+
+    def _check_day(self):
+        if time.time() >= self._reset_at:
+            self._roll_over()
+
+    def remaining(self, source):
+        """Points the source can still hand out today."""
+        self._check_day()
+        remaining = self.limits[source] - self.used[source]
+        if self.total_limit is not None:
+            remaining = min(remaining, self.total_limit - self.total)
+        return max(remaining, 0)
+
+    def exhausted(self, source):
+        return self.remaining(source) <= 0
+
+    def reserve(self, source, points):
+        """Take ``points`` from the source and global budget, all or nothing."""
+        if points > self.remaining(source):
+            return False
+        self.used[source] += points
+        self.total += points
+        return True
+
+    def release(self, source, points, date=None):
+        """Hand back a reservation that was never written to the db."""
+        if date is not None and date != self.date:
+            return
+        self.used[source] -= points
+        self.total -= points
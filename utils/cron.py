@@ -0,0 +1,84 @@
+import asyncio
+import inspect
+from datetime import datetime, timedelta
+
+
+def next_run(times, now):
+    """First of the daily UTC ``times`` that comes after ``now``."""
+    for run_time in times:
+        candidate = datetime.combine(now.date(), run_time)
+        if candidate > now:
+            return candidate
+    return datetime.combine(now.date() + timedelta(days=1), times[0])
+
+
+class Cron:
+    """Runs registered jobs at fixed UTC wall-clock times, every day.
+
+    One loop task sleeps until the next job is due instead of every job polling
+    the clock. Jobs are registered by name with a list of ``datetime.time``
+    values; the callback may be a plain function or a coroutine function.
+    """
+
+    def __init__(self):
+        self.jobs = {}  # name -> [times, callback, next_at]
+        self._wake = asyncio.Event()
+        self._fired = set()  # keep running jobs referenced until they finish
+        self._running = False
+        self._task = None
+
+    def register(self, name, times, callback):
+        times = sorted(times)
+        self.jobs[name] = [times, callback, next_run(times, datetime.utcnow())]
+        self._wake.set()
+
+    def unregister(self, name):
+        self.jobs.pop(name, None)
+
+    def start(self):
+        if self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._running = False
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while self._running:
+            now = datetime.utcnow()
+            if self.jobs:
+                fire_at = min(job[2] for job in self.jobs.values())
+                delay = (fire_at - now).total_seconds()
+            else:
+                delay = None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+
+            for name, job in list(self.jobs.items()):
+                times, callback, next_at = job
+                if next_at <= now:
+                    job[2] = next_run(times, now)
+                    task = asyncio.create_task(self._fire(name, callback))
+                    self._fired.add(task)
+                    task.add_done_callback(self._fired.discard)
+
+    @staticmethod
+    async def _fire(name, callback):
+        try:
+            result = callback()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as error:
+            print(f"An error occurred while running scheduled job {name} {error}")
@@ -0,0 +1,92 @@
+import asyncio
+from contextlib import asynccontextmanager
+import aiosqlite
+from utils.migrations import migrate
+
+DB_FILE = 'meme_bot.db'
+DEFAULT_READERS = 3
+BUSY_TIMEOUT_MS = 5000
+
+
+class Database:
+    """Shared SQLite storage for every cog.
+
+    Holds one dedicated writer connection (writes are serialised through a lock,
+    SQLite only allows one writer anyway) and a small pool of read connections.
+    The database runs in WAL mode so readers never block the writer.
+    Created once at startup and exposed to the cogs as ``bot.db``.
+    """
+
+    def __init__(self, path=DB_FILE, readers=DEFAULT_READERS):
+        self.path = path
+        self.reader_count = max(1, readers)
+        self._writer = None
+        self._readers = asyncio.Queue()
+        self._all_readers = []
+        self._write_lock = asyncio.Lock()
+
+    async def connect(self):
+        self._writer = await self._open()
+        await self._writer.execute("PRAGMA journal_mode=WAL")
+        await self._writer.commit()
+        for _ in range(self.reader_count):
+            reader = await self._open()
+            self._all_readers.append(reader)
+            self._readers.put_nowait(reader)
+
+    async def _open(self):
+        db = await aiosqlite.connect(self.path)
+        await db.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        await db.execute("PRAGMA temp_store=MEMORY")
+        return db
+
+    async def close(self):
+        for reader in self._all_readers:
+            await reader.close()
+        self._all_readers.clear()
+        self._readers = asyncio.Queue()
+        if self._writer is not None:
+            async with self._write_lock:
+                await self._writer.close()
+            self._writer = None
+
+    async def init_db(self):
+        return await migrate(self)
+
+    @asynccontextmanager
+    async def read(self):
+        """Borrow a read connection from the pool."""
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Run a block of writes on the writer connection.
+
+        Commits when the block exits cleanly, rolls back if it raises.
+        """
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            await self._writer.commit()
+
+    async def fetchone(self, sql, params=()):
+        async with self.read() as db:
+            async with db.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql, params=()):
+        async with self.read() as db:
+            async with db.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def execute(self, sql, params=()):
+        async with self.transaction() as db:
+            await db.execute(sql, params)
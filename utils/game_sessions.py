@@ -0,0 +1,94 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+
+class GameSessions:
+    """Running games keyed by the id of their game message.
+
+    Sessions are kept in least-recently-active order, so a single loop task that
+    sleeps until the oldest one goes idle replaces a timeout task per game. A
+    session is any object with an async ``expire()``, it's removed and expired
+    once nobody has touched it for ``idle_timeout`` seconds.
+    """
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self.expired = 0
+        self._sessions = OrderedDict()  # message_id -> (session, last_active)
+        self._wake = asyncio.Event()
+        self._expiring = set()  # keep expire() tasks referenced until they finish
+        self._running = False
+        self._task = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, message_id):
+        return message_id in self._sessions
+
+    def add(self, message_id, session):
+        self._sessions[message_id] = (session, time.monotonic())
+        self._sessions.move_to_end(message_id)
+        if len(self._sessions) == 1:
+            self._wake.set()
+
+    def get(self, message_id):
+        entry = self._sessions.get(message_id)
+        return entry[0] if entry else None
+
+    def touch(self, message_id):
+        """Mark the session as active, restarting its idle timeout."""
+        entry = self._sessions.get(message_id)
+        if entry is not None:
+            self._sessions[message_id] = (entry[0], time.monotonic())
+            self._sessions.move_to_end(message_id)
+
+    def remove(self, message_id):
+        entry = self._sessions.pop(message_id, None)
+        return entry[0] if entry else None
+
+    def start(self):
+        if self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._running = False
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while self._running:
+            now = time.monotonic()
+            while self._sessions:
+                message_id, (session, last_active) = next(iter(self._sessions.items()))
+                if last_active + self.idle_timeout > now:
+                    break
+                del self._sessions[message_id]
+                self.expired += 1
+                task = asyncio.create_task(self._expire(message_id, session))
+                self._expiring.add(task)
+                task.add_done_callback(self._expiring.discard)
+
+            if self._sessions:
+                delay = next(iter(self._sessions.values()))[1] + self.idle_timeout - now
+            else:
+                delay = None
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    @staticmethod
+    async def _expire(message_id, session):
+        try:
+            await session.expire()
+        except Exception as error:
+            print(f"An error occurred while expiring game {message_id} {error}")
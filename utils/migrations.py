@@ -0,0 +1,104 @@
+"""Versioned schema migrations for meme_bot.db.
+
+The schema version lives in ``PRAGMA user_version``. Each migration runs in its
+own transaction together with the version bump, so a crash half way through
+leaves the db at the previous version and the migration runs again next start.
+Add new migrations to the end of ``MIGRATIONS``, never edit one that has shipped.
+"""
+
+
+async def _initial_schema(db):
+    # databases created before migrations existed already have these tables,
+    # so everything here has to be safe to run on top of them
+    await db.execute('''CREATE TABLE IF NOT EXISTS users (
+                        user_id INTEGER PRIMARY KEY,
+                        points INTEGER DEFAULT 0,
+                        wallet_address TEXT,
+                        last_activity DATE)''')
+    await db.execute('''CREATE TABLE IF NOT EXISTS winners (
+                        date TEXT,
+                        user_id INTEGER,
+                        wallet_address TEXT,
+                        points_earned INTEGER DEFAULT 0,
+                        tokens INTEGER DEFAULT 0,
+                        status BOOLEAN DEFAULT FALSE,
+                        PRIMARY KEY (date, user_id))''')
+    await db.execute('''CREATE TABLE IF NOT EXISTS daily_points (
+                        date TEXT PRIMARY KEY,
+                        total_points_distributed INTEGER DEFAULT 0)''')
+
+    async with db.execute("PRAGMA table_info(winners)") as cursor:
+        columns = [column[1] for column in await cursor.fetchall()]
+    if 'status' not in columns:
+        await db.execute("ALTER TABLE winners ADD COLUMN status BOOLEAN DEFAULT FALSE")
+    if 'points_earned' not in columns:
+        await db.execute("ALTER TABLE winners ADD COLUMN points_earned INTEGER DEFAULT 0")
+    if 'tokens' not in columns:
+        await db.execute("ALTER TABLE winners ADD COLUMN tokens INTEGER DEFAULT 0")
+
+
+async def _daily_source_points(db):
+    await db.execute('''CREATE TABLE IF NOT EXISTS daily_source_points (
+                        date TEXT,
+                        source TEXT,
+                        points INTEGER DEFAULT 0,
+                        PRIMARY KEY (date, source))''')
+
+
+async def _lookup_indexes(db):
+    # submit_wallet looks users up by wallet and one wallet may only belong to one
+    # user. the same index also serves the reminder's `wallet_address IS NULL` check
+    async with db.execute(
+        "SELECT wallet_address FROM users WHERE wallet_address IS NOT NULL "
+        "GROUP BY wallet_address HAVING COUNT(*) > 1 LIMIT 1"
+    ) as cursor:
+        duplicate = await cursor.fetchone()
+    if duplicate:
+        print(f"Wallet {duplicate[0]} is used by more than one user, creating a non-unique wallet index")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_wallet ON users (wallet_address)")
+    else:
+        await db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_wallet ON users (wallet_address)")
+    # distributor.js pays out unpaid winners and marks them paid by wallet
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_winners_unpaid ON winners (wallet_address) WHERE status = 0")
+
+
+async def _scheduled_jobs(db):
+    await db.execute('''CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                        id INTEGER PRIMARY KEY,
+                        due_at REAL NOT NULL,
+                        kind TEXT NOT NULL,
+                        payload TEXT NOT NULL)''')
+
+
+async def _listener_state(db):
+    # the Raydium listener backfills from the last slot it processed after a restart or reconnect
+    await db.execute('''CREATE TABLE IF NOT EXISTS listener_state (
+                        name TEXT PRIMARY KEY,
+                        last_slot INTEGER NOT NULL)''')
+
+
+MIGRATIONS = [
+    _initial_schema,
+    _daily_source_points,
+    _lookup_indexes,
+    _scheduled_jobs,
+    _listener_state,
+]
+
+
+async def migrate(database):
+    """Bring the db up to the latest schema version, returns that version."""
+    async with database.transaction() as db:
+        async with db.execute("PRAGMA user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        async with database.transaction() as db:
+            await db.execute("BEGIN")
+            await migration(db)
+            await db.execute(f"PRAGMA user_version = {number}")
+        print(f"Migrated database to version {number} ({migration.__name__.strip('_')}).")
+
+    async with database.transaction() as db:
+        await db.execute("PRAGMA optimize")
+    return len(MIGRATIONS)
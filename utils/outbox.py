@@ -0,0 +1,237 @@
+import os
+import time
+import random
+import asyncio
+import itertools
+from collections import deque
+import discord
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# how many sends can be in flight at once
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+# messages per route (a channel or a user's DMs) allowed per ROUTE_PERIOD seconds
+ROUTE_RATE = int(os.getenv("OUTBOX_ROUTE_RATE", "5"))
+ROUTE_PERIOD = float(os.getenv("OUTBOX_ROUTE_PERIOD", "5"))
+# messages allowed per second across every route
+GLOBAL_RATE = int(os.getenv("OUTBOX_GLOBAL_RATE", "40"))
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+LATENCY_SAMPLES = 500
+
+INTERACTIVE = 0  # game replies and anything else a user is waiting on
+NORMAL = 1
+BULK = 2  # mass notifications, never allowed to take every worker
+
+
+class _Bucket:
+    __slots__ = ('capacity', 'refill_rate', 'tokens', 'updated')
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.refill_rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take a token, returns 0 or the seconds to wait for one."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.refill_rate
+
+    def full(self):
+        return self.tokens + (time.monotonic() - self.updated) * self.refill_rate >= self.capacity
+
+
+class _Job:
+    __slots__ = ('route', 'job', 'future', 'queued_at', 'attempt', 'has_route_token')
+
+    def __init__(self, route, job, future):
+        self.route = route
+        self.job = job
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.attempt = 0
+        self.has_route_token = False
+
+
+class Outbox:
+    """Central queue for outbound Discord messages.
+
+    Jobs are coroutine functions submitted with a route (``('dm', user_id)``,
+    ``('channel', channel_id)`` ...) and a priority. Each route has its own token
+    bucket on top of a global one, so a burst to one channel can't hit Discord's
+    rate limits and stall everything else. A route that's out of tokens parks
+    its jobs in order until its bucket refills, and a send that would go over the
+    global rate waits for it, so a backlog is never spun through looking for
+    something sendable. Interactive and normal jobs have the workers to
+    themselves, bulk jobs run beside them at most ``workers - 1`` at a time.
+    Failed sends are retried with exponential backoff on server errors and
+    network errors (discord.py handles 429s itself, retrying those again would
+    only stack the waits).
+    """
+
+    def __init__(self, workers=OUTBOX_WORKERS, route_rate=ROUTE_RATE, route_period=ROUTE_PERIOD, global_rate=GLOBAL_RATE):
+        self.workers = max(2, workers)
+        self.route_rate = route_rate
+        self.route_period = route_period
+        self._global = _Bucket(global_rate, 1)
+        self._buckets = {}
+        self._deferred = {}  # route -> deque of jobs waiting for the route's bucket, oldest first
+        self._queue = asyncio.PriorityQueue()
+        self._bulk_queue = asyncio.Queue()
+        self._bulk_slots = asyncio.Semaphore(self.workers - 1)
+        self._bulk_tasks = set()
+        self._counter = itertools.count()
+        self._tasks = []
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._bulk_dispatcher()))
+
+    async def close(self):
+        tasks = [*self._tasks, *self._bulk_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, route, job, priority=NORMAL):
+        """Queue ``job`` (a coroutine function) and return a future with its result.
+
+        Callers on a hot path can ignore the future, errors are logged either way.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        self._put((priority, next(self._counter), _Job(route, job, future)))
+        return future
+
+    def _put(self, item):
+        if item[0] == BULK:
+            self._bulk_queue.put_nowait(item)
+        else:
+            self._queue.put_nowait(item)
+
+    def _bucket(self, route):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                self._buckets = {key: value for key, value in self._buckets.items() if not value.full() or key in self._deferred}
+            bucket = self._buckets[route] = _Bucket(self.route_rate, self.route_period)
+        return bucket
+
+    async def _admit(self, item):
+        """Take the tokens to send ``item`` now, waiting on the global rate. False if it was parked instead."""
+        job = item[2]
+        if not job.has_route_token:
+            deferred = self._deferred.get(job.route)
+            if deferred is not None:
+                deferred.append(item)  # behind the route's other parked jobs
+                return False
+            delay = self._bucket(job.route).take()
+            if delay:
+                self._deferred[job.route] = deque([item])
+                asyncio.get_running_loop().call_later(delay, self._release, job.route)
+                return False
+        job.has_route_token = False
+        while delay := self._global.take():
+            await asyncio.sleep(delay)
+        return True
+
+    def _release(self, route):
+        """Hand the oldest job parked on ``route`` back to the workers once its bucket has a token."""
+        bucket = self._buckets[route]
+        deferred = self._deferred[route]
+        delay = bucket.take()
+        if not delay:
+            item = deferred.popleft()
+            item[2].has_route_token = True
+            self._put(item)
+            if not deferred:
+                del self._deferred[route]
+                return
+            delay = 1 / bucket.refill_rate
+        asyncio.get_running_loop().call_later(delay, self._release, route)
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            if await self._admit(item):
+                await self._run(item)
+
+    async def _bulk_dispatcher(self):
+        while True:
+            item = await self._bulk_queue.get()
+            # a bulk send only starts once a bulk slot is free, the workers stay free for everything else
+            await self._bulk_slots.acquire()
+            try:
+                admitted = await self._admit(item)
+            except BaseException:
+                self._bulk_slots.release()
+                raise
+            if not admitted:
+                self._bulk_slots.release()
+                continue
+            task = asyncio.create_task(self._run_bulk(item))
+            self._bulk_tasks.add(task)
+            task.add_done_callback(self._bulk_tasks.discard)
+
+    async def _run_bulk(self, item):
+        try:
+            await self._run(item)
+        finally:
+            self._bulk_slots.release()
+
+    async def _run(self, item):
+        job = item[2]
+        try:
+            result = await job.job()
+        except Exception as error:
+            if job.attempt < MAX_RETRIES and self._retryable(error):
+                self.retried += 1
+                delay = RETRY_BASE_DELAY * 2 ** job.attempt + random.uniform(0, RETRY_BASE_DELAY)
+                job.attempt += 1
+                asyncio.get_running_loop().call_later(delay, self._put, item)
+                return
+            self.pending -= 1
+            self.failed += 1
+            print(f"An error occurred while sending to {job.route} {error}")
+            if not job.future.done():
+                job.future.set_exception(error)
+                job.future.exception()  # mark it retrieved, nobody may be awaiting it
+            return
+        self.pending -= 1
+        self.sent += 1
+        self._latencies.append(time.monotonic() - job.queued_at)
+        if not job.future.done():
+            job.future.set_result(result)
+
+    @staticmethod
+    def _retryable(error):
+        if isinstance(error, discord.HTTPException):
+            # discord.py already waits out and retries 429s itself
+            return error.status >= 500
+        return isinstance(error, (asyncio.TimeoutError, OSError))
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            'queued': self._queue.qsize() + self._bulk_queue.qsize() + sum(map(len, self._deferred.values())),
+            'pending': self.pending,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+            'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
@@ -0,0 +1,143 @@
+import os
+import asyncio
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# set POINTS_WRITE_BEHIND=0 to commit every award straight away
+WRITE_BEHIND = os.getenv("POINTS_WRITE_BEHIND", "1") not in ("0", "false", "False")
+# seconds between flushes, i.e. the most awards we can lose if the process dies
+FLUSH_INTERVAL = float(os.getenv("POINTS_FLUSH_INTERVAL", "2"))
+# flush early once this many awards are waiting
+MAX_BATCH = int(os.getenv("POINTS_MAX_BATCH", "500"))
+
+
+class PointsLedger:
+    """Collects point awards in memory and writes them to the db in batches.
+
+    Each award touches ``users.points``, the ``winners`` row for the day, the
+    ``daily_points`` total and the per-source ``daily_source_points`` total. In
+    write-behind mode the increments are summed in memory and written as one
+    transaction every ``flush_interval`` seconds, or sooner once ``max_batch``
+    awards are pending, plus a final flush on close. With write-behind off every
+    award is committed straight away.
+    """
+
+    def __init__(self, db, write_behind=WRITE_BEHIND, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.db = db
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._users = {}  # user_id -> [points, last_activity]
+        self._winners = Counter()  # (date, user_id) -> points
+        self._daily = Counter()  # date -> points
+        self._sources = Counter()  # (date, source) -> points
+        self._flushing = {}  # users of the batch being written right now
+        self.flushes = 0
+        self._pending = 0
+        self._flush_needed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._running = False
+        self._task = None
+
+    def start(self):
+        if self.write_behind and self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            # no cancel: the loop wakes up, finishes the flush it's on and returns,
+            # so a close can never land in the middle of a batch being written
+            self._running = False
+            self._flush_needed.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while self._running:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except Exception as error:
+                print(f"An error occurred while flushing points ledger {error}")
+
+    async def register(self, user_id, date):
+        """Make sure the user has a row, without giving them any points."""
+        await self.award(user_id, date, 0)
+
+    async def award(self, user_id, date, points, source='chat'):
+        user = self._users.setdefault(user_id, [0, date])
+        user[0] += points
+        if points:
+            self._winners[(date, user_id)] += points
+            self._daily[date] += points
+            self._sources[(date, source)] += points
+        self._pending += 1
+
+        if not self.write_behind:
+            await self.flush()
+        elif self._pending >= self.max_batch:
+            self._flush_needed.set()
+
+    def pending_points(self, user_id):
+        """Points awarded to the user that the db doesn't show yet.
+
+        Readers that combine this with a db read should compare ``flushes``
+        before and after the read and retry if a flush finished in between.
+        """
+        user = self._users.get(user_id)
+        flushing = self._flushing.get(user_id)
+        return (user[0] if user else 0) + (flushing[0] if flushing else 0)
+
+    def has_pending(self, user_id):
+        return user_id in self._users or user_id in self._flushing
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            users, winners, daily, sources = self._users, self._winners, self._daily, self._sources
+            self._users, self._winners, self._daily, self._sources = {}, Counter(), Counter(), Counter()
+            pending, self._pending = self._pending, 0
+            self._flushing = users
+            try:
+                async with self.db.transaction() as db:
+                    await db.executemany(
+                        "INSERT INTO users (user_id, points, last_activity) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET points = points + excluded.points",
+                        [(user_id, points, last_activity) for user_id, (points, last_activity) in users.items()]
+                    )
+                    await db.executemany(
+                        "INSERT INTO winners (date, user_id, points_earned) VALUES (?, ?, ?) "
+                        "ON CONFLICT(date, user_id) DO UPDATE SET points_earned = points_earned + excluded.points_earned",
+                        [(date, user_id, points) for (date, user_id), points in winners.items()]
+                    )
+                    await db.executemany(
+                        "INSERT INTO daily_points (date, total_points_distributed) VALUES (?, ?) "
+                        "ON CONFLICT(date) DO UPDATE SET total_points_distributed = total_points_distributed + excluded.total_points_distributed",
+                        list(daily.items())
+                    )
+                    await db.executemany(
+                        "INSERT INTO daily_source_points (date, source, points) VALUES (?, ?, ?) "
+                        "ON CONFLICT(date, source) DO UPDATE SET points = points + excluded.points",
+                        [(date, source, points) for (date, source), points in sources.items()]
+                    )
+            except BaseException:
+                # put the batch back so the next flush retries it
+                for user_id, (points, last_activity) in users.items():
+                    self._users.setdefault(user_id, [0, last_activity])[0] += points
+                self._winners.update(winners)
+                self._daily.update(daily)
+                self._sources.update(sources)
+                self._pending += pending
+                raise
+            finally:
+                self._flushing = {}
+                self.flushes += 1
@@ -0,0 +1,182 @@
+import os
+import time
+import random
+import asyncio
+from collections import Counter, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# most game results written in one transaction
+SETTLEMENT_BATCH_SIZE = int(os.getenv("SETTLEMENT_BATCH_SIZE", "100"))
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+LAG_SAMPLES = 500
+
+
+class GameResult:
+    __slots__ = ('source', 'user_id', 'points', 'max_user_points', 'on_settled', 'queued_at')
+
+    def __init__(self, source, user_id, points, max_user_points, on_settled):
+        self.source = source
+        self.user_id = user_id
+        self.points = points
+        self.max_user_points = max_user_points
+        self.on_settled = on_settled
+        self.queued_at = time.monotonic()
+
+
+class Settlement:
+    """Pays out game wins in the background so game replies never wait on the db.
+
+    Games ``submit`` a result and answer the interaction straight away. A single
+    worker takes whatever is queued, up to ``batch_size`` results, caps each win
+    by the user's daily points and the source's budget, and writes the batch in
+    one transaction, retrying the batch with backoff if a lookup or the write
+    fails (reserved budget is handed back each time). Each result's
+    ``on_settled(points, user)`` callback runs afterwards, with 0 points if
+    nothing could be awarded, and ``user`` None if the batch couldn't be settled.
+    """
+
+    def __init__(self, db, budget, user_cache, batch_size=SETTLEMENT_BATCH_SIZE):
+        self.db = db
+        self.budget = budget
+        self.user_cache = user_cache
+        self.batch_size = batch_size
+        self._queue = asyncio.Queue()
+        self._lags = deque(maxlen=LAG_SAMPLES)
+        self._task = None
+        self.settled = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Settle what's still queued, then stop the worker."""
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+    def submit(self, source, user_id, points, max_user_points, on_settled=None):
+        """Queue a win worth ``points``, the user can't go over ``max_user_points`` today."""
+        self._queue.put_nowait(GameResult(source, user_id, points, max_user_points, on_settled))
+
+    async def _run(self):
+        stopping = False
+        while not stopping or not self._queue.empty():
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stopping = stopping or None in batch
+            results = [result for result in batch if result is not None]
+            if results:
+                try:
+                    await self._settle(results)
+                except Exception as error:
+                    print(f"An error occurred while settling game results {error}")
+
+    async def _settle(self, results):
+        for attempt in range(MAX_RETRIES + 1):
+            awards = []
+            try:
+                awards = await self._allocate(results)
+                users, winners, daily, sources = Counter(), Counter(), Counter(), Counter()
+                for result, points, _, date in awards:
+                    if points:
+                        users[result.user_id] += points
+                        winners[(date, result.user_id)] += points
+                        daily[date] += points
+                        sources[(date, result.source)] += points
+                if users:
+                    await self._write(users, winners, daily, sources)
+                break
+            except Exception as error:
+                self._release(awards)
+                if attempt == MAX_RETRIES:
+                    self.failed += len(results)
+                    print(f"An error occurred while settling {len(results)} game results, giving up {error}")
+                    await self._notify((result, 0, None) for result in results)
+                    return
+                self.retried += 1
+                await asyncio.sleep(RETRY_BASE_DELAY * 2 ** attempt + random.uniform(0, RETRY_BASE_DELAY))
+
+        for user_id in users:
+            self.user_cache.invalidate(user_id)
+        now = time.monotonic()
+        for result in results:
+            self._lags.append(now - result.queued_at)
+        self.settled += len(results)
+        await self._notify((result, points, user) for result, points, user, _ in awards)
+
+    async def _allocate(self, results):
+        """Cap each win and reserve its budget, [(result, points, user, date)].
+
+        If a lookup fails partway, whatever was already reserved is released before raising.
+        """
+        awards = []
+        batch_points = Counter()  # wins earlier in this batch aren't in the cache yet
+        try:
+            for result in results:
+                user = await self.user_cache.get(result.user_id)
+                current_points = user.points + batch_points[result.user_id]
+                points = min(result.max_user_points - current_points, result.points)
+                if points > 0 and self.budget.reserve(result.source, points):
+                    batch_points[result.user_id] += points
+                    awards.append((result, points, user, self.budget.date))
+                else:
+                    awards.append((result, 0, user, None))
+        except Exception:
+            self._release(awards)
+            raise
+        return awards
+
+    def _release(self, awards):
+        for result, points, _, date in awards:
+            if points:
+                self.budget.release(result.source, points, date)
+
+    async def _notify(self, outcomes):
+        for result, points, user in outcomes:
+            if result.on_settled is not None:
+                try:
+                    await result.on_settled(points, user)
+                except Exception as error:
+                    print(f"An error occurred while notifying {result.user_id} of their {result.source} win {error}")
+
+    async def _write(self, users, winners, daily, sources):
+        async with self.db.transaction() as db:
+            await db.executemany(
+                "INSERT INTO users (user_id, points) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET points = points + excluded.points",
+                list(users.items())
+            )
+            await db.executemany(
+                "INSERT INTO winners (date, user_id, points_earned, tokens, status) VALUES (?, ?, ?, ?, FALSE) "
+                "ON CONFLICT(date, user_id) DO UPDATE SET points_earned = points_earned + excluded.points_earned, tokens = tokens + excluded.tokens",
+                [(date, user_id, points, points) for (date, user_id), points in winners.items()]
+            )
+            await db.executemany(
+                "INSERT INTO daily_points (date, total_points_distributed) VALUES (?, ?) "
+                "ON CONFLICT(date) DO UPDATE SET total_points_distributed = total_points_distributed + excluded.total_points_distributed",
+                list(daily.items())
+            )
+            await db.executemany(
+                "INSERT INTO daily_source_points (date, source, points) VALUES (?, ?, ?) "
+                "ON CONFLICT(date, source) DO UPDATE SET points = points + excluded.points",
+                [(date, source, points) for (date, source), points in sources.items()]
+            )
+
+    def stats(self):
+        lags = sorted(self._lags)
+        return {
+            'queued': self._queue.qsize(),
+            'settled': self.settled,
+            'failed': self.failed,
+            'retried': self.retried,
+            'lag_p50': lags[len(lags) // 2] if lags else 0.0,
+            'lag_p95': lags[int(len(lags) * 0.95)] if lags else 0.0,
+        }
@@ -0,0 +1,129 @@
+import json
+import time
+import heapq
+import asyncio
+from collections import defaultdict
+
+TIMER_BATCH_SIZE = 100
+# seconds before a timer whose action failed is run again, doubling up to the max
+TIMER_RETRY_BASE_DELAY = 60
+TIMER_RETRY_MAX_DELAY = 3600
+
+
+class TimerScheduler:
+    """Durable one-shot timers, e.g. "delete this channel in 24 hours".
+
+    Timers are stored in the ``scheduled_jobs`` table and mirrored in an in-memory
+    heap driven by a single loop task, so they survive restarts and don't each
+    hold a sleeping task. Cogs register an async handler per ``kind``; a handler
+    receives a list of payloads so many timers coming due at once are handled as
+    one batch, and returns whether each one's action went through. A timer is
+    only removed once it did; otherwise (or if the handler raises) it's run
+    again with exponential backoff, and picked up from the db after a restart.
+    """
+
+    def __init__(self, db, batch_size=TIMER_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.handlers = {}
+        self._heap = []  # (due_at, job_id, kind, payload)
+        self._attempts = {}  # job_id -> failed runs so far
+        self._wake = asyncio.Event()
+        self._running = False
+        self._task = None
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    async def start(self):
+        """Load the pending timers from the db and start the loop."""
+        rows = await self.db.fetchall("SELECT id, due_at, kind, payload FROM scheduled_jobs")
+        self._heap = [(due_at, job_id, kind, json.loads(payload)) for job_id, due_at, kind, payload in rows]
+        heapq.heapify(self._heap)
+        if self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            # wait_for can swallow a cancel that races the wake event, so flag it too
+            self._running = False
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def schedule(self, kind, payload, delay):
+        """Run ``kind``'s handler with ``payload`` in ``delay`` seconds, returns the timer id."""
+        due_at = time.time() + delay
+        async with self.db.transaction() as db:
+            cursor = await db.execute(
+                "INSERT INTO scheduled_jobs (due_at, kind, payload) VALUES (?, ?, ?)",
+                (due_at, kind, json.dumps(payload))
+            )
+            job_id = cursor.lastrowid
+        heapq.heappush(self._heap, (due_at, job_id, kind, payload))
+        if self._heap[0][1] == job_id:
+            self._wake.set()
+        return job_id
+
+    def pending(self):
+        return len(self._heap)
+
+    async def _run(self):
+        while self._running:
+            if self._heap:
+                delay = self._heap[0][0] - time.time()
+            else:
+                delay = None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            try:
+                await self._run_due()
+            except Exception as error:
+                print(f"An error occurred while running timers {error}")
+
+    async def _run_due(self):
+        now = time.time()
+        batches = defaultdict(list)
+        count = 0
+        while self._heap and self._heap[0][0] <= now and count < self.batch_size:
+            _, job_id, kind, payload = heapq.heappop(self._heap)
+            batches[kind].append((job_id, payload))
+            count += 1
+
+        done = []
+        for kind, jobs in batches.items():
+            handler = self.handlers.get(kind)
+            if handler is None:
+                # leave them in the db, they'll be picked up again after a restart
+                print(f"No handler registered for {len(jobs)} '{kind}' timers, skipping them")
+                continue
+            try:
+                results = await handler([payload for _, payload in jobs])
+            except Exception as error:
+                print(f"An error occurred while handling '{kind}' timers {error}")
+                results = [False] * len(jobs)
+            failed = 0
+            for (job_id, payload), ok in zip(jobs, results):
+                if ok:
+                    done.append((job_id,))
+                    self._attempts.pop(job_id, None)
+                    continue
+                failed += 1
+                attempts = self._attempts[job_id] = self._attempts.get(job_id, 0) + 1
+                delay = min(TIMER_RETRY_BASE_DELAY * 2 ** (attempts - 1), TIMER_RETRY_MAX_DELAY)
+                heapq.heappush(self._heap, (time.time() + delay, job_id, kind, payload))
+            if failed:
+                print(f"{failed} '{kind}' timers failed, retrying them later")
+
+        if done:
+            async with self.db.transaction() as db:
+                await db.executemany("DELETE FROM scheduled_jobs WHERE id = ?", done)
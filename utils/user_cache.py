@@ -0,0 +1,115 @@
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "5000"))
+# seconds before a cached user is read from the db again
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+
+class UserState:
+    __slots__ = ('points', 'wallet_address', 'registered')
+
+    def __init__(self, points=0, wallet_address=None, registered=False):
+        self.points = points
+        self.wallet_address = wallet_address
+        self.registered = registered
+
+    def capped(self, max_points):
+        return self.points >= max_points
+
+
+class UserCache:
+    """Bounded LRU cache of per-user state in front of the ``users`` table.
+
+    Points include awards the ledger hasn't flushed yet, so callers don't need to
+    add ``ledger.pending_points`` themselves. Every code path that changes a user
+    has to write through with ``add_points``, ``set_wallet`` or ``invalidate``.
+    """
+
+    def __init__(self, db, ledger, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.db = db
+        self.ledger = ledger
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (state, expires_at)
+        self._loading = {}  # user_id -> [loads in flight, changes seen while loading]
+
+    async def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        while True:
+            loading = self._loading.setdefault(user_id, [0, 0])
+            loading[0] += 1
+            changes = loading[1]
+            flushes = self.ledger.flushes
+            try:
+                row = await self.db.fetchone("SELECT points, wallet_address FROM users WHERE user_id=?", (user_id,))
+            finally:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[user_id]
+            # a write landed while we were reading, the row may already be stale
+            if changes == loading[1] and flushes == self.ledger.flushes:
+                break
+
+        pending = self.ledger.pending_points(user_id)
+        if row:
+            state = UserState(row[0] + pending, row[1], True)
+        else:
+            state = UserState(pending, None, self.ledger.has_pending(user_id))
+        self._store(user_id, state)
+        return state
+
+    def _store(self, user_id, state):
+        self._entries[user_id] = (state, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _changed(self, user_id):
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            loading[1] += 1
+        entry = self._entries.get(user_id)
+        return entry[0] if entry else None
+
+    def add_points(self, user_id, points):
+        """Record points written for the user, this also registers them."""
+        state = self._changed(user_id)
+        if state is not None:
+            state.points += points
+            state.registered = True
+
+    def set_wallet(self, user_id, wallet_address):
+        state = self._changed(user_id)
+        if state is not None:
+            state.wallet_address = wallet_address
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            for loading in self._loading.values():
+                loading[1] += 1
+            self._entries.clear()
+            return
+        self._changed(user_id)
+        self._entries.pop(user_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }